@@ -1,12 +1,28 @@
 from __future__ import annotations
 
+import datetime
 import enum
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import discord
 
-from sqlalchemy import BigInteger, Column, Integer, Boolean, Enum, String, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Integer,
+    Boolean,
+    DateTime,
+    Enum,
+    String,
+    ForeignKey,
+    Index,
+    Table,
+    inspect,
+    or_,
+    text,
+)
+from sqlalchemy.orm import relationship, selectinload
+from sqlalchemy.types import SchemaType
 
 from pie.database import database, session
 
@@ -21,6 +37,12 @@ class RestrictionType(enum.Enum):
     DISALLOW = 1
 
 
+class ApplyMode(enum.Enum):
+    BUTTONS = 0
+    TOGGLE = 1
+    REPLACE = 2
+
+
 class RBMessage(database.base):
     """Holds list of messages with assigned RBView.
     It should be mainly used to update messages on RBView edit
@@ -30,6 +52,7 @@ class RBMessage(database.base):
         message_id: ID of message
         channel_id: ID of message's channel
         view_id: ID of parent RB View
+        verified_at: When the message was last found on Discord
     """
 
     __tablename__ = "fsi_rolebutton_message"
@@ -37,6 +60,7 @@ class RBMessage(database.base):
     message_id = Column(BigInteger, primary_key=True)
     channel_id = Column(BigInteger)
     view_id = Column(Integer, ForeignKey("fsi_rolebutton_view.idx"), primary_key=True)
+    verified_at = Column(DateTime, nullable=True)
     rbview = relationship(lambda: RBView, back_populates="messages")
 
     @staticmethod
@@ -44,6 +68,58 @@ class RBMessage(database.base):
         query = session.query(RBMessage).filter_by(message_id=message_id).one_or_none()
         return query
 
+    @staticmethod
+    def get_unverified(before: datetime.datetime) -> List[RBMessage]:
+        """Get messages which were not verified since given time.
+
+        Args:
+            before: Messages verified after this time are skipped
+
+        Returns:
+            List of RBMessages
+        """
+        query = session.query(RBMessage).filter(
+            or_(RBMessage.verified_at.is_(None), RBMessage.verified_at < before)
+        )
+
+        return query.all()
+
+    @staticmethod
+    def verify(
+        alive_ids: Iterable[int],
+        dead_ids: Iterable[int],
+        verified_at: datetime.datetime,
+    ) -> int:
+        """Record verification time of alive messages and remove dead ones
+        in single transaction.
+
+        Args:
+            alive_ids: IDs of messages found on Discord
+            dead_ids: IDs of messages which no longer exist
+            verified_at: Time of verification
+
+        Returns:
+            Number of removed messages
+        """
+        alive_ids = list(alive_ids)
+        dead_ids = list(dead_ids)
+        removed = 0
+
+        if alive_ids:
+            session.query(RBMessage).filter(RBMessage.message_id.in_(alive_ids)).update(
+                {RBMessage.verified_at: verified_at}, synchronize_session=False
+            )
+        if dead_ids:
+            removed = (
+                session.query(RBMessage)
+                .filter(RBMessage.message_id.in_(dead_ids))
+                .delete(synchronize_session=False)
+            )
+
+        session.commit()
+
+        return removed
+
     def __repr__(self) -> str:
         return (
             f'<RBMessage message_id="{self.message_id}" channel_id="{self.channel_id}" '
@@ -55,6 +131,7 @@ class RBMessage(database.base):
             "message_id": self.message_id,
             "channel_id": self.channel_id,
             "view_id": self.view_id,
+            "verified_at": self.verified_at,
             "rbview": self.rbview,
         }
 
@@ -104,6 +181,8 @@ class RBView(database.base):
         idx: Unique ID of RB View
         guild_id: Guild ID of View
         unique: Whether user can choose more or one role
+        mode: How the selected option is applied, defined in :class:`ApplyMode`
+        max_values: How many options can be selected at once (ignored if unique)
         message: Relationship pointing to RBMessage
         restrictions: Relationship pointing to RBRestriction
         options: Relationship pointing to RBOption (View select item)
@@ -114,20 +193,35 @@ class RBView(database.base):
     idx = Column(Integer, primary_key=True, autoincrement=True)
     guild_id = Column(BigInteger)
     unique = Column(Boolean)
+    mode = Column(Enum(ApplyMode), default=ApplyMode.BUTTONS)
+    max_values = Column(Integer, default=1)
     messages = relationship(
         lambda: RBMessage, cascade="all, delete", back_populates="rbview"
     )
     restrictions = relationship(lambda: RBRestriction, cascade="all, delete")
-    options = relationship(lambda: RBOption, cascade="all, delete")
+    options = relationship(
+        lambda: RBOption, cascade="all, delete", back_populates="rbview"
+    )
+
+    @staticmethod
+    def _query():
+        """Create query loading whole View graph (messages, restrictions,
+        options and their items) in fixed number of queries.
+        """
+        return session.query(RBView).options(
+            selectinload(RBView.messages),
+            selectinload(RBView.restrictions),
+            selectinload(RBView.options).selectinload(RBOption.items),
+        )
 
     @staticmethod
     def get_all(guild: discord.Guild = None) -> List[RBView]:
-        query = session.query(RBView)
+        query = RBView._query()
 
         if guild is not None:
-            query.filter_by(guild_id=guild.id)
+            query = query.filter_by(guild_id=guild.id)
 
-        return query.all()
+        return query.order_by(RBView.idx).all()
 
     @staticmethod
     def create(guild: discord.Guild, unique: bool) -> Optional[RBView]:
@@ -137,9 +231,15 @@ class RBView(database.base):
 
         return view
 
+    @staticmethod
+    def get_many(ids: Iterable[int]) -> List[RBView]:
+        query = RBView._query().filter(RBView.idx.in_(list(ids)))
+
+        return query.all()
+
     @staticmethod
     def get(guild: discord.Guild, id: int) -> Optional[RBView]:
-        query = session.query(RBView).filter_by(idx=id, guild_id=guild.id)
+        query = RBView._query().filter_by(idx=id, guild_id=guild.id)
 
         return query.one_or_none()
 
@@ -178,10 +278,141 @@ class RBView(database.base):
         session.delete(message)
         session.commit()
 
+    @staticmethod
+    def prune(discord_id: int, option_ids: Iterable[int]) -> int:
+        """Remove items and access roles referencing deleted
+        role or channel in single transaction.
+
+        Restrictions are kept, so view restricted to deleted role
+        stays locked until the restriction is removed by moderator.
+
+        Args:
+            discord_id: ID of deleted role or channel
+            option_ids: IDs of options which have item with the ID
+
+        Returns:
+            Number of removed rows
+        """
+        option_ids = list(option_ids)
+        removed = 0
+
+        if option_ids:
+            removed += (
+                session.query(RBItem)
+                .filter(
+                    RBItem.discord_id == discord_id, RBItem.option_id.in_(option_ids)
+                )
+                .delete(synchronize_session=False)
+            )
+        removed += (
+            session.query(RBAccessRole)
+            .filter(
+                or_(
+                    RBAccessRole.channel_id == discord_id,
+                    RBAccessRole.role_id == discord_id,
+                )
+            )
+            .delete(synchronize_session=False)
+        )
+
+        session.commit()
+
+        return removed
+
     def add_option(self, option: RBOption):
         self.options.append(option)
         session.commit()
 
+    def export(self) -> dict:
+        """Serialize View's configuration (without messages)
+        to JSON compatible dictionary.
+
+        Returns:
+            Configuration accepted by :meth:`restore` (after validation)
+        """
+        return {
+            "unique": bool(self.unique),
+            "mode": (self.mode or ApplyMode.BUTTONS).name,
+            "max_values": self.max_values or 1,
+            "restrictions": [
+                {"role_id": restriction.role_id, "type": restriction.type.name}
+                for restriction in self.restrictions
+            ],
+            "options": [
+                {
+                    "label": option.label,
+                    "description": option.description,
+                    "emoji": option.emoji,
+                    "order": option.oid,
+                    "items": [
+                        {"discord_id": item.discord_id, "type": item.discord_type.name}
+                        for item in option.items
+                    ],
+                }
+                for option in sorted(self.options, key=lambda x: (x.oid, x.label))
+            ],
+        }
+
+    @staticmethod
+    def restore(
+        guild: discord.Guild, data: dict, view: Optional[RBView] = None
+    ) -> RBView:
+        """Restore View's configuration in single transaction.
+
+        Options and restrictions of existing View are replaced,
+        it's messages are kept.
+
+        Args:
+            guild: Guild of View
+            data: Validated configuration with `unique`, `mode` (:class:`ApplyMode`),
+                `max_values`, `restrictions` (tuples of role ID and :class:`RestrictionType`)
+                and `options` (dicts with `label`, `description`, `emoji`, `order`
+                and `items` as tuples of Discord ID and :class:`DiscordType`)
+            view: View to replace configuration of, new View is created if None
+
+        Returns:
+            Restored View
+        """
+        try:
+            if view is None:
+                view = RBView(guild_id=guild.id)
+                session.add(view)
+            else:
+                for option in view.options:
+                    session.delete(option)
+                for restriction in view.restrictions:
+                    session.delete(restriction)
+                session.flush()
+                session.expire(view, ["options", "restrictions"])
+
+            view.unique = data["unique"]
+            view.mode = data["mode"]
+            view.max_values = data["max_values"]
+
+            for role_id, type in data["restrictions"]:
+                view.restrictions.append(RBRestriction(role_id=role_id, type=type))
+
+            for option in data["options"]:
+                view.options.append(
+                    RBOption(
+                        label=option["label"],
+                        description=option["description"],
+                        emoji=option["emoji"],
+                        oid=option["order"],
+                        items=[
+                            RBItem(discord_id=discord_id, discord_type=discord_type)
+                            for discord_id, discord_type in option["items"]
+                        ],
+                    )
+                )
+
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+        return view
+
     def delete(self):
         session.delete(self)
         session.commit()
@@ -192,7 +423,8 @@ class RBView(database.base):
     def __repr__(self) -> str:
         return (
             f'<RBView idx="{self.idx}" guild_id="{self.guild_id}" '
-            f'unique="{self.unique}" messages="{self.messages}" '
+            f'unique="{self.unique}" mode="{self.mode}" '
+            f'max_values="{self.max_values}" messages="{self.messages}" '
             f'restrictions="{self.restrictions}" options="{self.options}" >'
         )
 
@@ -201,6 +433,8 @@ class RBView(database.base):
             "idx": self.idx,
             "guild_id": self.guild_id,
             "unique": self.unique,
+            "mode": self.mode,
+            "max_values": self.max_values,
             "messages": self.messages,
             "restrictions": self.restrictions,
             "options": self.options,
@@ -233,10 +467,13 @@ class RBOption(database.base):
     rbview = relationship(lambda: RBView, back_populates="options")
 
     def get(guild: discord.Guild, option_id: int) -> Optional[RBItem]:
-        query = session.query(RBOption).filter_by(idx=option_id).one_or_none()
-
-        if query is not None and query.rbview.guild_id != guild.id:
-            return None
+        query = (
+            session.query(RBOption)
+            .join(RBOption.rbview)
+            .filter(RBOption.idx == option_id, RBView.guild_id == guild.id)
+            .options(selectinload(RBOption.items))
+            .one_or_none()
+        )
 
         return query
 
@@ -244,6 +481,15 @@ class RBOption(database.base):
         self.items.append(item)
         session.commit()
 
+    def add_items(self, items: List[RBItem]):
+        self.items.extend(items)
+        session.commit()
+
+    def remove_items(self, items: List[RBItem]):
+        for item in items:
+            session.delete(item)
+        session.commit()
+
     def save(self):
         session.commit()
 
@@ -314,3 +560,304 @@ class RBItem(database.base):
             "discord_id": self.discord_id,
             "discord_type": self.discord_type,
         }
+
+
+class RBAccessRole(database.base):
+    """Bot-managed role which grants access to channel.
+    Channel has single overwrite for this role, so channel items
+    assigned to options are granted by adding the role to member
+    instead of creating member's permission overwrite.
+
+    Attributes:
+        channel_id: ID of channel
+        guild_id: ID of channel's guild
+        role_id: ID of access role
+    """
+
+    __tablename__ = "fsi_rolebutton_access_role"
+
+    channel_id = Column(BigInteger, primary_key=True)
+    guild_id = Column(BigInteger)
+    role_id = Column(BigInteger)
+
+    @staticmethod
+    def add(channel: discord.abc.GuildChannel, role: discord.Role) -> RBAccessRole:
+        access_role = RBAccessRole(
+            channel_id=channel.id, guild_id=channel.guild.id, role_id=role.id
+        )
+        session.merge(access_role)
+        session.commit()
+
+        return access_role
+
+    @staticmethod
+    def get(channel_id: int) -> Optional[RBAccessRole]:
+        query = (
+            session.query(RBAccessRole).filter_by(channel_id=channel_id).one_or_none()
+        )
+        return query
+
+    @staticmethod
+    def get_all(guild: discord.Guild = None) -> List[RBAccessRole]:
+        query = session.query(RBAccessRole)
+
+        if guild is not None:
+            query = query.filter_by(guild_id=guild.id)
+
+        return query.all()
+
+    def delete(self):
+        session.delete(self)
+        session.commit()
+
+    def __repr__(self) -> str:
+        return (
+            f'<RBAccessRole channel_id="{self.channel_id}" guild_id="{self.guild_id}" '
+            f'role_id="{self.role_id}">'
+        )
+
+    def dump(self) -> dict:
+        return {
+            "channel_id": self.channel_id,
+            "guild_id": self.guild_id,
+            "role_id": self.role_id,
+        }
+
+
+class RBOptionStats(database.base):
+    """Holds how many times was each RBOption added and removed by users.
+    The counts are collected in memory and written in batches
+    (see :class:`OptionCounter`), so there's no row written per interaction.
+
+    Attributes:
+        option_id: ID of RB Option
+        view_id: ID of Option's RB View
+        added: Number of times the option was added
+        removed: Number of times the option was removed
+    """
+
+    __tablename__ = "fsi_rolebutton_option_stats"
+
+    option_id = Column(Integer, primary_key=True)
+    view_id = Column(Integer, index=True)
+    added = Column(Integer, default=0)
+    removed = Column(Integer, default=0)
+
+    @staticmethod
+    def increment(counts: Dict[int, Tuple[int, int, int]]):
+        """Add counts to stored stats (inserting missing rows)
+        in single transaction.
+
+        Args:
+            counts: Mapping of option ID and tuple of view ID,
+                added and removed count
+        """
+        if not counts:
+            return
+
+        stats = {
+            stat.option_id: stat
+            for stat in session.query(RBOptionStats).filter(
+                RBOptionStats.option_id.in_(list(counts))
+            )
+        }
+
+        for option_id, (view_id, added, removed) in counts.items():
+            stat = stats.get(option_id, None)
+            if stat is None:
+                session.add(
+                    RBOptionStats(
+                        option_id=option_id,
+                        view_id=view_id,
+                        added=added,
+                        removed=removed,
+                    )
+                )
+            else:
+                stat.added += added
+                stat.removed += removed
+
+        try:
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+    @staticmethod
+    def get_by_view(view_id: int) -> Dict[int, RBOptionStats]:
+        """Get stats of View's options.
+
+        Args:
+            view_id: ID of RB View
+
+        Returns:
+            Mapping of option ID and it's stats
+        """
+        query = session.query(RBOptionStats).filter_by(view_id=view_id)
+
+        return {stat.option_id: stat for stat in query}
+
+    def __repr__(self) -> str:
+        return (
+            f'<RBOptionStats option_id="{self.option_id}" view_id="{self.view_id}" '
+            f'added="{self.added}" removed="{self.removed}">'
+        )
+
+    def dump(self) -> dict:
+        return {
+            "option_id": self.option_id,
+            "view_id": self.view_id,
+            "added": self.added,
+            "removed": self.removed,
+        }
+
+
+class RBAuditEntry(database.base):
+    """Holds roles and channels added to and removed from members
+    by RoleButtons. Entries are collected in memory and inserted
+    in batches (see :class:`AuditQueue`), so there's no row written
+    during the interaction.
+
+    Attributes:
+        idx: Unique ID of entry
+        guild_id: ID of guild
+        member_id: ID of affected member
+        discord_id: ID of added or removed role or channel
+        discord_type: Type of Discord object
+        added: True if the item was added, False if removed
+        timestamp: When the change was applied
+    """
+
+    __tablename__ = "fsi_rolebutton_audit"
+
+    idx = Column(Integer, primary_key=True, autoincrement=True)
+    guild_id = Column(BigInteger)
+    member_id = Column(BigInteger)
+    discord_id = Column(BigInteger)
+    discord_type = Column(Enum(DiscordType))
+    added = Column(Boolean)
+    timestamp = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_fsi_rolebutton_audit_member", guild_id, member_id, timestamp),
+        Index("ix_fsi_rolebutton_audit_item", guild_id, discord_id, timestamp),
+        Index("ix_fsi_rolebutton_audit_time", guild_id, timestamp),
+    )
+
+    @staticmethod
+    def add_many(entries: List[dict]):
+        """Insert entries by single bulk insert.
+
+        Args:
+            entries: List of mappings of entry's columns
+        """
+        if not entries:
+            return
+
+        try:
+            session.bulk_insert_mappings(RBAuditEntry, entries)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+    @staticmethod
+    def search(
+        guild: discord.Guild,
+        member_id: Optional[int] = None,
+        discord_id: Optional[int] = None,
+        since: Optional[datetime.datetime] = None,
+        until: Optional[datetime.datetime] = None,
+        limit: int = 100,
+    ) -> List[RBAuditEntry]:
+        """Get newest entries of guild matching the filters.
+
+        Args:
+            guild: Guild of entries
+            member_id: ID of affected member
+            discord_id: ID of role or channel
+            since: Oldest time of entries
+            until: Newest time of entries
+            limit: Maximal number of returned entries
+
+        Returns:
+            List of entries ordered from the newest
+        """
+        query = session.query(RBAuditEntry).filter_by(guild_id=guild.id)
+
+        if member_id is not None:
+            query = query.filter_by(member_id=member_id)
+        if discord_id is not None:
+            query = query.filter_by(discord_id=discord_id)
+        if since is not None:
+            query = query.filter(RBAuditEntry.timestamp >= since)
+        if until is not None:
+            query = query.filter(RBAuditEntry.timestamp <= until)
+
+        return (
+            query.order_by(RBAuditEntry.timestamp.desc(), RBAuditEntry.idx.desc())
+            .limit(limit)
+            .all()
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f'<RBAuditEntry idx="{self.idx}" guild_id="{self.guild_id}" '
+            f'member_id="{self.member_id}" discord_id="{self.discord_id}" '
+            f'discord_type="{self.discord_type}" added="{self.added}" '
+            f'timestamp="{self.timestamp}">'
+        )
+
+    def dump(self) -> dict:
+        return {
+            "idx": self.idx,
+            "guild_id": self.guild_id,
+            "member_id": self.member_id,
+            "discord_id": self.discord_id,
+            "discord_type": self.discord_type,
+            "added": self.added,
+            "timestamp": self.timestamp,
+        }
+
+
+def _add_columns(table: Table, names: Iterable[str]):
+    """Add missing columns to existing table.
+
+    Args:
+        table: Table of DB object
+        names: Names of columns which may be missing
+    """
+    inspector = inspect(database.db)
+    if not inspector.has_table(table.name):
+        # Table will be created by create_all with all columns
+        return
+
+    existing = {column["name"] for column in inspector.get_columns(table.name)}
+
+    with database.db.begin() as connection:
+        for name in names:
+            if name in existing:
+                continue
+            column = table.c[name]
+            if isinstance(column.type, SchemaType):
+                column.type.create(connection, checkfirst=True)
+            connection.execute(
+                text(
+                    "ALTER TABLE {table} ADD COLUMN {column} {type}".format(
+                        table=table.name,
+                        column=column.name,
+                        type=column.type.compile(dialect=connection.dialect),
+                    )
+                )
+            )
+
+
+def migrate():
+    """Add columns introduced after the tables were created.
+
+    Tables are created by `create_all`, which does not alter existing
+    tables, so columns added later have to be added here.
+    It must be called before the tables are queried.
+    """
+    _add_columns(RBView.__table__, ("mode", "max_values"))
+    _add_columns(RBMessage.__table__, ("verified_at",))
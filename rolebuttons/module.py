@@ -1,70 +1,951 @@
+import asyncio
+import datetime
+import json
+import tempfile
+import time
+
 import discord
 from discord.ext import commands, tasks
 
-from typing import Dict, List, Optional, Union
+from typing import Dict, List, Optional, Set, Tuple, Union
 
-from pie import i18n, logger, utils, check
+from pie import i18n, logger, utils, check, storage
 from pie.utils.objects import ConfirmView, ScrollableEmbed
 
-from .objects import RBViewUI
-from .database import RBView, RestrictionType, RBOption, RBItem, DiscordType, RBMessage
-from .utils import RBUtils as rbutils
+from .objects import (
+    CUSTOM_ID_REGEX,
+    AuditQueue,
+    OptionCounter,
+    RBCompiledView,
+    RBMemberQueue,
+    RBMessageSnapshot,
+    RBReverseIndex,
+    RBViewSnapshot,
+    RBViewUI,
+    SelectionCache,
+)
+from .database import (
+    ApplyMode,
+    RBAccessRole,
+    RBView,
+    RestrictionType,
+    RBOption,
+    RBItem,
+    DiscordType,
+    RBMessage,
+    RBOptionStats,
+    RBAuditEntry,
+    migrate,
+)
+from .utils import EmojiIndex, ErrorReporter, RBUtils as rbutils
 
 _ = i18n.Translator("modules/fsi").translate
 guild_log = logger.Guild.logger()
 bot_log = logger.Bot.logger()
 
+# Limits shared by all guilds, changed by `rolebuttons limit set`
+LIMITS = {
+    "reattach_limit": 10,
+    "selection_ttl": 900.0,
+    "selection_size": 10000,
+    "error_window": 3600.0,
+    "reconcile_interval": 6 * 3600.0,
+    "reconcile_limit": 2,
+}
+
 
 class RoleButtons(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        migrate()
+
         self.views = {}
+        self.guilds = set()
+        self.references = RBReverseIndex()
+        self.access_roles = {}
+        self.emojis = EmojiIndex()
+
+        # Limits of message re-attaching on startup
+        self.reattach_limit = self._get_limit("reattach_limit")
+        self.reattach_retries = 5
+        self.reattach_report = 50
+
+        # Re-attaching of all guilds shares the limit and rate limit backoff
+        # (monotonic time of backoff end for each channel ID)
+        self.reattach_semaphore = asyncio.Semaphore(self.reattach_limit)
+        self.reattach_backoff: Dict[int, float] = {}
+
+        # Limits of selected options cache
+        self.selection_ttl = self._get_limit("selection_ttl")
+        self.selection_size = self._get_limit("selection_size")
+
+        self.selections = SelectionCache(
+            ttl=self.selection_ttl, maxsize=self.selection_size
+        )
+
+        # Repeated errors of invalid IDs are logged once per window
+        self.error_window = self._get_limit("error_window")
+
+        # Verification of attached messages (messages verified
+        # in last interval are skipped)
+        self.reconcile_interval = self._get_limit("reconcile_interval")
+        self.reconcile_limit = self._get_limit("reconcile_limit")
+        self.reconcile_batch = 50
+
+        # Counts of added and removed options are written once per interval
+        self.stats_interval = 300.0
+
+        # Audit entries are inserted once per interval, queue drops
+        # the oldest entries when full
+        self.audit_interval = 10.0
+        self.audit_size = 100000
+        self.audit_limit = 100
+
+        self.reporter = ErrorReporter(window=self.error_window)
+        self.audit = AuditQueue(maxsize=self.audit_size)
+        self.queue = RBMemberQueue(
+            reporter=self.reporter, audit=self.audit, access_roles=self.access_roles
+        )
+        self.counter = OptionCounter()
 
         self.load_views.start()
+        self.flush_errors.start()
+        self.reconcile_messages.change_interval(seconds=self.reconcile_interval)
+        self.reconcile_messages.start()
+        self.flush_stats.change_interval(seconds=self.stats_interval)
+        self.flush_stats.start()
+        self.flush_audit.change_interval(seconds=self.audit_interval)
+        self.flush_audit.start()
 
     def cog_unload(self):
         self._unload_views()
+        self.flush_errors.cancel()
+        self.reconcile_messages.cancel()
+        self.flush_stats.cancel()
+        self.flush_audit.cancel()
 
     # HELPER FUNCTIONS
+    def _get_limit(self, name: str) -> Union[int, float]:
+        """Get stored value of limit.
+
+        Args:
+            name: Name of limit (key of `LIMITS`)
+
+        Returns:
+            Stored value or default value of limit
+        """
+        default = LIMITS[name]
+        return type(default)(storage.get(self, 0, key=name, default_value=default))
+
+    def _apply_limits(self):
+        """Propagate changed limits into their users."""
+        self.reattach_semaphore = asyncio.Semaphore(self.reattach_limit)
+        self.selections.resize(ttl=self.selection_ttl, maxsize=self.selection_size)
+        self.reporter.window = self.error_window
+        self.reconcile_messages.change_interval(seconds=self.reconcile_interval)
+
     def _unload_views(self):
         """Unload all views. It's used in reload commands
         or when unloading / reloading module.
         """
-        for id, view in self.views.items():
-            view.stop()
-
         self.views = {}
+        self.guilds = set()
+        self.references = RBReverseIndex()
+        # Mapping is shared with member queue, so it's cleared in place
+        self.access_roles.clear()
+
+    def _unload_view(self, view_id: int):
+        """Unload single view.
+
+        Args:
+            view_id: ID of View
+        """
+        self.views.pop(view_id, None)
+        self.references.remove(view_id)
+
+    def _load_view(self, view: RBView) -> RBCompiledView:
+        """Take snapshot of view and compile it.
+
+        Loaded view gets the new snapshot, so the change is applied at once.
+
+        Args:
+            view: RBView DB object
+
+        Returns:
+            Compiled view
+        """
+        snapshot = RBViewSnapshot.from_db(view)
+        compiled = self.views.get(view.idx)
+        if compiled is None:
+            compiled = RBCompiledView(
+                self.emojis,
+                snapshot,
+                self.access_roles,
+                self.queue,
+                self.selections,
+                self.counter,
+            )
+            self.views[view.idx] = compiled
+        else:
+            compiled.compile(snapshot)
+        self.references.update(snapshot)
+
+        return compiled
+
+    async def _refresh_view(self, guild: discord.Guild, view_id: int):
+        """Reload view after it's configuration changed
+        and re-render messages the view is attached to.
+
+        Messages are fetched only if the rendered view changed
+        (e.g. not after change of items) and only those whose components
+        differ from the rendered view are edited.
+
+        Args:
+            guild: Guild of changed View
+            view_id: ID of changed View
+        """
+        view = RBView.get(guild, view_id)
+        if view is None:
+            self._unload_view(view_id)
+            return
+
+        compiled = self.views.get(view_id)
+        previous = (
+            rbutils.components_signature(compiled.render().to_components())
+            if compiled is not None
+            else None
+        )
+
+        compiled = self._load_view(view)
+
+        messages = compiled.view.messages
+        if not messages:
+            return
+
+        view_ui = compiled.render()
+        if rbutils.components_signature(view_ui.to_components()) == previous:
+            return
+
+        await asyncio.gather(
+            *[self._reattach_message(view_ui, message) for message in messages],
+            return_exceptions=True,
+        )
+
+    async def _prune(self, guild: discord.Guild, discord_id: int):
+        """Remove items and access roles of deleted role or channel
+        and refresh affected views.
+
+        Restrictions of deleted role are kept (view restricted only
+        to deleted role stays locked) and moderators are informed by log.
+
+        Affected views are found by reverse index, so nothing happens
+        if the role or channel is not used by any view.
+
+        Args:
+            guild: Guild of deleted role or channel
+            discord_id: ID of deleted role or channel
+        """
+        references = set(self.references.get(discord_id))
+
+        for view_id in sorted(
+            view_id for view_id, option_id in references if option_id is None
+        ):
+            await guild_log.warning(
+                None,
+                guild,
+                f"RoleButtons View {view_id} has restriction of deleted role {discord_id}. "
+                f"It's kept until it's removed by "
+                f"'rolebuttons restriction remove {view_id} {discord_id}'.",
+            )
+
+        # Channels granted by deleted access role are granted by overwrites again
+        channels = [
+            channel
+            for channel, role in self.access_roles.items()
+            if discord_id in (channel, role)
+        ]
+        # Access role of deleted channel has no use anymore
+        orphaned = [
+            role for channel, role in self.access_roles.items() if channel == discord_id
+        ]
+        for channel in channels:
+            del self.access_roles[channel]
+            references.update(self.references.get(channel))
+
+        references = {
+            (view_id, option_id)
+            for view_id, option_id in references
+            if option_id is not None
+        }
+        if not references and not channels:
+            return
+
+        view_ids = {view_id for view_id, option_id in references}
+        option_ids = {option_id for view_id, option_id in references}
+
+        removed = RBView.prune(discord_id, option_ids)
+
+        await guild_log.info(
+            None,
+            guild,
+            f"Removed {removed} RoleButtons records of deleted role or channel {discord_id}.",
+        )
+
+        for role_id in orphaned:
+            await self._delete_access_role(guild, role_id)
+
+        for view_id in view_ids:
+            await self._refresh_view(guild, view_id)
+
+    async def _delete_access_role(self, guild: discord.Guild, role_id: int):
+        """Delete Discord role created for access to deleted channel.
+
+        Moderators are informed by log if the role can't be deleted.
+
+        Args:
+            guild: Guild of the role
+            role_id: ID of access role
+        """
+        role = guild.get_role(role_id)
+        if role is None:
+            return
+        try:
+            await role.delete(reason="RoleButtons access role")
+        except discord.HTTPException as ex:
+            await guild_log.warning(
+                None,
+                guild,
+                f"Can't delete RoleButtons access role {role_id} of deleted channel. "
+                f"It has to be deleted manually.",
+                exception=ex,
+            )
+
+    async def _migrate_access(
+        self, channels: List[discord.abc.GuildChannel]
+    ) -> Tuple[int, int]:
+        """Grant channels by access roles instead of member overwrites.
+
+        Creates access role with single overwrite for each channel
+        (if it does not exist yet) and converts existing member overwrites
+        to the access roles. Each member's roles are added by single call.
+
+        Only `read_messages` is removed from converted overwrite,
+        other permissions set by the overwrite are kept. Members which
+        are not cached are fetched, overwrites of members who left
+        the guild are skipped.
+
+        Args:
+            channels: List of channels to migrate
+
+        Returns:
+            Tuple of converted and skipped member overwrites
+        """
+        members = {}
+        converted = 0
+        skipped = 0
+
+        for channel in channels:
+            access_role = RBAccessRole.get(channel.id)
+            role = (
+                channel.guild.get_role(access_role.role_id)
+                if access_role is not None
+                else None
+            )
+            if role is None:
+                role = await channel.guild.create_role(
+                    name=channel.name, reason="RoleButtons access role"
+                )
+                RBAccessRole.add(channel, role)
+            self.access_roles[channel.id] = role.id
+
+            await channel.set_permissions(
+                role, read_messages=True, reason="RoleButtons access role"
+            )
+
+            for target, overwrite in channel.overwrites.items():
+                if not overwrite.read_messages or isinstance(target, discord.Role):
+                    continue
+                if not isinstance(target, discord.Member):
+                    # Overwrite of uncached member or role
+                    if channel.guild.get_role(target.id) is not None:
+                        continue
+                    try:
+                        target = await channel.guild.fetch_member(target.id)
+                    except discord.NotFound:
+                        skipped += 1
+                        continue
+                members.setdefault(target, []).append((channel, role, overwrite))
+
+        for member, grants in members.items():
+            await member.add_roles(
+                *[role for channel, role, overwrite in grants],
+                reason="RoleButtons access role",
+            )
+            for channel, role, overwrite in grants:
+                overwrite.update(read_messages=None)
+                await channel.set_permissions(
+                    member,
+                    overwrite=None if overwrite.is_empty() else overwrite,
+                    reason="RoleButtons access role",
+                )
+                converted += 1
+
+        return converted, skipped
+
+    async def _wait_for_channel(self, channel_id: int):
+        """Sleep until the rate limit backoff of channel passes.
+
+        Args:
+            channel_id: ID of channel
+        """
+        delay = self.reattach_backoff.get(channel_id, 0) - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.reattach_backoff.get(channel_id, 0) - time.monotonic()
+
+    async def _reattach_message(
+        self,
+        view_ui: RBViewUI,
+        message: RBMessageSnapshot,
+    ) -> Optional[bool]:
+        """Fetch Discord message and attach view to it.
+
+        Message is edited only if it's components differ from the view's.
+        Number of concurrent requests of all guilds is limited
+        by `reattach_limit`. When Discord rate-limits the request,
+        all requests into the same channel are postponed by Discord's
+        Retry-After and the request is retried.
+
+        Args:
+            view_ui: View to attach
+            message: Snapshot of RBMessage DB object
+
+        Returns:
+            True if message was edited, False if message already had
+            the view's components, None if view could not be attached.
+        """
+        for attempt in range(self.reattach_retries):
+            await self._wait_for_channel(message.channel_id)
+            async with self.reattach_semaphore:
+                try:
+                    dc_message = await utils.discord.get_message(
+                        self.bot,
+                        view_ui.compiled.view.guild_id,
+                        message.channel_id,
+                        message.message_id,
+                    )
+                    if not dc_message:
+                        await bot_log.warning(
+                            None,
+                            None,
+                            f"Can't assign RoleButtons view."
+                            f"Message with id {message.message_id} in channel {message.channel_id} not found! ",
+                        )
+                        return None
+                    if not self._needs_edit(dc_message, view_ui):
+                        return False
+                    await dc_message.edit(view=view_ui)
+                    return True
+                except discord.HTTPException as ex:
+                    if ex.status != 429:
+                        await bot_log.error(
+                            None,
+                            None,
+                            f"Can't assign RoleButtons view to message {message.message_id}.",
+                            exception=ex,
+                        )
+                        return None
+                    retry_after = self._retry_after(ex, 2**attempt)
+                    self.reattach_backoff[message.channel_id] = max(
+                        self.reattach_backoff.get(message.channel_id, 0),
+                        time.monotonic() + retry_after,
+                    )
+
+        await bot_log.warning(
+            None,
+            None,
+            f"Can't assign RoleButtons view to message {message.message_id}. "
+            "Rate limit retries exceeded.",
+        )
+        return None
+
+    def _retry_after(self, ex: discord.HTTPException, default: float) -> float:
+        """Get delay requested by Discord's rate limit response.
+
+        Args:
+            ex: Exception of rate-limited request
+            default: Delay used if the response does not contain it
+
+        Returns:
+            Number of seconds to wait
+        """
+        headers = getattr(ex.response, "headers", None) or {}
+        try:
+            return float(headers.get("Retry-After", default))
+        except (TypeError, ValueError):
+            return default
+
+    def _needs_edit(self, dc_message: discord.Message, view_ui: RBViewUI) -> bool:
+        """Check if message's components differ from components
+        rendered by view.
+
+        Args:
+            dc_message: Discord message
+            view_ui: View which should be attached
+
+        Returns:
+            True if message has to be edited, False otherwise.
+        """
+        current = rbutils.components_signature(
+            [component.to_dict() for component in dc_message.components]
+        )
+        expected = rbutils.components_signature(view_ui.to_components())
+
+        return current != expected
+
+    async def _reattach_messages(
+        self,
+        guild: discord.Guild,
+        attachments: List[Tuple[RBViewUI, RBMessageSnapshot]],
+    ):
+        """Attach views to their messages concurrently.
+
+        Number of concurrent requests is limited by `reattach_limit`
+        (shared by all guilds).
+        Verification time of messages found on Discord is recorded.
+
+        Args:
+            guild: Guild of the views
+            attachments: List of tuples of view and RBMessage snapshot
+        """
+        start = time.monotonic()
+        total = len(attachments)
+        done = 0
+        failed = 0
+        unchanged = 0
+        alive = []
+
+        async def reattach(view_ui: RBViewUI, message: RBMessageSnapshot):
+            nonlocal done, failed, unchanged
+            result = await self._reattach_message(view_ui, message)
+            if result is None:
+                failed += 1
+            else:
+                alive.append(message.message_id)
+            if result is False:
+                unchanged += 1
+            done += 1
+            if done % self.reattach_report == 0 and done != total:
+                print(
+                    f"RoleButtons views re-attached to {done}/{total} messages "
+                    f"in guild {guild.name}."
+                )
+
+        results = await asyncio.gather(
+            *[reattach(view_ui, message) for view_ui, message in attachments],
+            return_exceptions=True,
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            failed += len(errors)
+            await bot_log.error(
+                None,
+                None,
+                f"{len(errors)} RoleButtons views could not be re-attached "
+                f"in guild {guild.name}.",
+                exception=errors[0],
+            )
+
+        RBMessage.verify(alive, [], datetime.datetime.now())
+
+        log = (
+            f"RoleButtons views re-attached to {total - failed}/{total} messages "
+            f"in guild {guild.name} ({unchanged} without changes) "
+            f"in {time.monotonic() - start:.2f} s."
+        )
+        print(log)
+        await bot_log.info(None, None, log)
+
+    async def _load_guild(self, guild: discord.Guild):
+        """Load views of guild and re-attach them to their messages.
+
+        Guild is loaded only once, until it's unloaded.
+        All views are compiled before any message is fetched,
+        so the buttons work while the messages are being edited.
+        Views are rendered only for views attached to some message.
+
+        Args:
+            guild: Available guild
+        """
+        if guild.id in self.guilds:
+            return
+        self.guilds.add(guild.id)
+
+        self.access_roles.update(
+            {
+                access_role.channel_id: access_role.role_id
+                for access_role in RBAccessRole.get_all(guild)
+            }
+        )
+
+        attachments = []
+
+        for view in RBView.get_all(guild):
+            compiled = self._load_view(view)
+
+            if compiled.view.messages:
+                view_ui = compiled.render()
+                for message in compiled.view.messages:
+                    attachments.append((view_ui, message))
+
+        if attachments:
+            await self._reattach_messages(guild, attachments)
+
+    async def _index_emojis(self, guild: discord.Guild, emojis: List[discord.Emoji]):
+        """Update indexed emojis of guild and re-attach loaded views
+        using the changed ones.
+
+        Views of other guilds may be loaded before the guild's emojis
+        are known (their options are rendered without the emoji),
+        so their messages are fixed once the emojis are indexed.
+
+        Args:
+            guild: Guild of emojis
+            emojis: Actual emojis of guild
+        """
+        changed = self.emojis.update(guild.id, emojis)
+        await self._refresh_emojis(changed)
+
+    async def _refresh_emojis(self, emoji_ids: Set[int]):
+        """Re-attach loaded views using some of the emojis.
+
+        Args:
+            emoji_ids: IDs of added, removed or renamed emojis
+        """
+        if not emoji_ids:
+            return
+
+        emoji_ids = {str(emoji_id) for emoji_id in emoji_ids}
+        attachments = {}
+
+        for compiled in self.views.values():
+            if not compiled.view.messages or not any(
+                option.emoji in emoji_ids for option in compiled.view.options
+            ):
+                continue
+            view_ui = compiled.render()
+            attachments.setdefault(compiled.view.guild_id, []).extend(
+                (view_ui, message) for message in compiled.view.messages
+            )
+
+        for guild_id, guild_attachments in attachments.items():
+            view_guild = self.bot.get_guild(guild_id)
+            if view_guild is not None:
+                await self._reattach_messages(view_guild, guild_attachments)
+
+    def _unload_guild(self, guild: discord.Guild):
+        """Release views of guild.
+
+        Args:
+            guild: Removed guild
+        """
+        self.guilds.discard(guild.id)
+
+        for view_id in [
+            view_id
+            for view_id, compiled in self.views.items()
+            if compiled.view.guild_id == guild.id
+        ]:
+            self._unload_view(view_id)
+
+        for access_role in RBAccessRole.get_all(guild):
+            self.access_roles.pop(access_role.channel_id, None)
 
     @tasks.loop(seconds=10.0, count=1)
     async def load_views(self):
-        """Task used to load all view as persistent.
+        """Task used to load views of guilds which are not loaded yet.
         It has count=1 so it runs only once after called.
         Also using before_loop it ensures this is run only
         after bot is ready.
+
+        Guilds becoming available are loaded by listeners,
+        so this loads guilds which were available before the module was loaded
+        (or all guilds after reload).
         """
-        self.views = {}
+        self.emojis.build(guild for guild in self.bot.guilds if not guild.unavailable)
+
+        await asyncio.gather(
+            *[
+                self._load_guild(guild)
+                for guild in self.bot.guilds
+                if not guild.unavailable
+            ]
+        )
 
-        views = RBView.get_all()
+        print("All RoleButtons persistent views loaded.")
 
-        for view in views:
-            view_ui = RBViewUI(self.bot, view)
-            self.views[view.idx] = view_ui
-            self.bot.add_view(view_ui)
+    async def _reconcile_channel(
+        self,
+        semaphore: asyncio.Semaphore,
+        channel_id: int,
+        messages: List[Tuple[int, int]],
+    ) -> Tuple[int, Set[int]]:
+        """Verify messages of single channel by batches.
+
+        Messages not found on Discord are removed and verification time
+        of found messages is recorded after each batch. Messages of guilds
+        which are not available and of channels whose state is unknown
+        are skipped.
+
+        Args:
+            semaphore: Semaphore limiting number of concurrently verified channels
+            channel_id: ID of channel
+            messages: List of tuples of message ID and view ID
 
-            for message in view.messages:
-                dc_message = await utils.discord.get_message(
-                    self.bot, view.guild_id, message.channel_id, message.message_id
+        Returns:
+            Number of removed messages and IDs of views which lost a message
+        """
+        removed = 0
+        view_ids = set()
+
+        compiled = self.views.get(messages[0][1])
+        guild = self.bot.get_guild(compiled.view.guild_id) if compiled else None
+        if guild is None or guild.unavailable:
+            return removed, view_ids
+
+        async with semaphore:
+            deleted = False
+            # Archived threads are not cached, so the channel is removed
+            # only if Discord confirms it does not exist
+            channel = guild.get_channel_or_thread(channel_id)
+            if channel is None:
+                try:
+                    channel = await guild.fetch_channel(channel_id)
+                except discord.NotFound:
+                    deleted = True
+                except (discord.HTTPException, discord.InvalidData):
+                    # Unknown state, it's verified next time
+                    return removed, view_ids
+            if not deleted and not hasattr(channel, "fetch_message"):
+                return removed, view_ids
+
+            for i in range(0, len(messages), self.reconcile_batch):
+                alive = []
+                dead = []
+                for message_id, view_id in messages[i : i + self.reconcile_batch]:
+                    if deleted:
+                        dead.append((message_id, view_id))
+                        continue
+                    try:
+                        await channel.fetch_message(message_id)
+                    except discord.NotFound:
+                        dead.append((message_id, view_id))
+                    except discord.HTTPException:
+                        # Unknown state, it's verified next time
+                        continue
+                    else:
+                        alive.append(message_id)
+
+                removed += RBMessage.verify(
+                    alive,
+                    [message_id for message_id, view_id in dead],
+                    datetime.datetime.now(),
                 )
-                if dc_message:
-                    await dc_message.edit(view=view_ui)
-                else:
-                    await bot_log.warning(
-                        None,
-                        None,
-                        f"Can't assign RoleButtons view."
-                        f"Message with id {message.message_id} in channel {message.channel_id} not found! ",
-                    )
-        print("All RoleButtons persistent views loaded.")
+                view_ids.update(view_id for message_id, view_id in dead)
+
+        return removed, view_ids
+
+    @tasks.loop(hours=6.0)
+    async def reconcile_messages(self):
+        """Task periodically verifying that attached messages still exist.
+
+        Only messages not verified during last `reconcile_interval` are checked.
+        Channels are verified concurrently (limited by `reconcile_limit`),
+        messages of each channel by batches of `reconcile_batch`.
+        Views which lost some message are reloaded.
+        """
+        await self._wait_for_load()
+
+        before = datetime.datetime.now() - datetime.timedelta(
+            seconds=self.reconcile_interval
+        )
+        channels = {}
+        for message in RBMessage.get_unverified(before):
+            channels.setdefault(message.channel_id, []).append(
+                (message.message_id, message.view_id)
+            )
+
+        if not channels:
+            return
+
+        semaphore = asyncio.Semaphore(self.reconcile_limit)
+        results = await asyncio.gather(
+            *[
+                self._reconcile_channel(semaphore, channel_id, messages)
+                for channel_id, messages in channels.items()
+            ]
+        )
+
+        removed = sum(count for count, view_ids in results)
+        view_ids = {view_id for count, ids in results for view_id in ids}
+        if view_ids:
+            for view in RBView.get_many(view_ids):
+                if view.idx in self.views:
+                    self._load_view(view)
+
+        if removed:
+            await bot_log.info(
+                None,
+                None,
+                f"Removed {removed} RoleButtons messages which no longer exist.",
+            )
+
+    @reconcile_messages.before_loop
+    async def before_reconcile(self):
+        """Ensures that bot is ready and views are loaded
+        before verifying messages."""
+        await self.bot.wait_until_ready()
+        await self._wait_for_load()
+
+    async def _wait_for_load(self):
+        """Wait until running `load_views` task finishes.
+
+        Exceptions of the task are not propagated, they are handled
+        by the task itself.
+        """
+        task = self.load_views.get_task()
+        if task is not None and not task.done():
+            await asyncio.wait([task])
+
+    @tasks.loop(seconds=60.0)
+    async def flush_errors(self):
+        """Log summaries of invalid IDs found while processing interactions."""
+        await self.reporter.flush()
+
+    @flush_errors.after_loop
+    async def after_flush_errors(self):
+        """Log all remaining errors when the module is unloaded."""
+        await self.reporter.flush(force=True)
+
+    async def _flush_stats(self):
+        """Write counts of added and removed options in single batch.
+        If the write fails, counts are kept for the next attempt.
+        """
+        counts = self.counter.pop()
+        if not counts:
+            return
+
+        try:
+            RBOptionStats.increment(counts)
+        except Exception as ex:
+            self.counter.restore(counts)
+            await bot_log.error(
+                None,
+                None,
+                "Could not write RoleButtons option stats.",
+                exception=ex,
+            )
+
+    @tasks.loop(minutes=5.0)
+    async def flush_stats(self):
+        """Task periodically writing counts of added and removed options."""
+        await self._flush_stats()
+
+    @flush_stats.after_loop
+    async def after_flush_stats(self):
+        """Write remaining counts when the module is unloaded."""
+        await self._flush_stats()
+
+    async def _flush_audit(self):
+        """Insert queued audit entries by single bulk insert.
+        If the insert fails, entries are returned to the queue.
+        """
+        entries = self.audit.pop()
+        if not entries:
+            return
+
+        try:
+            RBAuditEntry.add_many(entries)
+        except Exception as ex:
+            self.audit.restore(entries)
+            await bot_log.error(
+                None,
+                None,
+                "Could not write RoleButtons audit entries.",
+                exception=ex,
+            )
+
+    @tasks.loop(seconds=10.0)
+    async def flush_audit(self):
+        """Task periodically writing roles and channels
+        added to and removed from members.
+        """
+        await self._flush_audit()
+
+    @flush_audit.after_loop
+    async def after_flush_audit(self):
+        """Write remaining entries when the module is unloaded."""
+        await self._flush_audit()
+
+    @commands.Cog.listener()
+    async def on_guild_emojis_update(
+        self,
+        guild: discord.Guild,
+        before: List[discord.Emoji],
+        after: List[discord.Emoji],
+    ):
+        """Keep emoji index up to date."""
+        await self._index_emojis(guild, after)
+
+    @commands.Cog.listener()
+    async def on_guild_available(self, guild: discord.Guild):
+        """Index emojis and load views of guild as soon as it's available."""
+        await self._index_emojis(guild, guild.emojis)
+        await self._load_guild(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild):
+        """Index emojis and load views of joined guild."""
+        await self._index_emojis(guild, guild.emojis)
+        await self._load_guild(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        """Release emojis and views of left guild."""
+        removed = self.emojis.remove(guild.id)
+        self._unload_guild(guild)
+        await self._refresh_emojis(removed)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        """Remove deleted role from views."""
+        await self._prune(role.guild, role.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        """Remove deleted channel from views."""
+        await self._prune(channel.guild, channel.id)
+
+    @commands.Cog.listener()
+    async def on_interaction(self, interaction: discord.Interaction):
+        """Route interactions of RoleButtons components to compiled views.
+
+        Single listener handles all views, so no persistent
+        :class:`discord.ui.View` has to be registered for each view.
+        """
+        if interaction.type != discord.InteractionType.component:
+            return
+
+        match = CUSTOM_ID_REGEX.match(interaction.data.get("custom_id", ""))
+        if match is None:
+            return
+
+        compiled = self.views.get(int(match.group(1)))
+        if compiled is None:
+            return
+
+        arg = int(match.group(3)) if match.group(3) is not None else None
+        await compiled.dispatch(interaction, match.group(2), arg)
 
     @load_views.before_loop
     async def before_load(self):
@@ -108,6 +989,40 @@ class RoleButtons(commands.Cog):
 
         return embed
 
+    async def _get_items_embed(
+        self, ctx, option: RBOption, items: List[RBItem]
+    ) -> discord.Embed:
+        """Create information embed for multiple items of option.
+
+        Args:
+            ctx: Command context
+            option: Items' parent DB object.
+            items: List of RBItems for information
+
+        Returns: :class:`discord.Embed` information embed
+        """
+        if len(items) == 1:
+            return await self._get_item_embed(ctx, option, items[0])
+
+        embed = utils.discord.create_embed(
+            author=ctx.author, title=_(ctx, "Item information")
+        )
+
+        roles, channels = await rbutils.process_items(items, ctx.guild)
+        found = {dc_item.id: dc_item.mention for dc_item in roles + channels}
+
+        embed.add_field(name=_(ctx, "Option ID"), value=option.idx)
+        embed.add_field(
+            name=_(ctx, "Items"),
+            value=", ".join(
+                found.get(item.discord_id, "({id})".format(id=item.discord_id))
+                for item in items
+            ),
+            inline=False,
+        )
+
+        return embed
+
     async def _get_view_embed(self, ctx, view) -> discord.Embed:
         """Create information embed for View.
 
@@ -128,6 +1043,16 @@ class RoleButtons(commands.Cog):
             value=_(ctx, "Yes") if view.unique else _(ctx, "No"),
             inline=True,
         )
+        embed.add_field(
+            name=_(ctx, "Mode"),
+            value=(view.mode or ApplyMode.BUTTONS).name,
+            inline=True,
+        )
+        embed.add_field(
+            name=_(ctx, "Maximum of selected options"),
+            value=1 if view.unique else (view.max_values or 1),
+            inline=True,
+        )
 
         embed.add_field(
             name=_(ctx, "Messages"),
@@ -191,7 +1116,7 @@ class RoleButtons(commands.Cog):
         )
         embed.add_field(
             name=_(ctx, "Emoji"),
-            value=rbutils.emoji_decode(self.bot, option.emoji),
+            value=rbutils.emoji_decode(self.emojis, option.emoji),
             inline=True,
         )
         embed.add_field(
@@ -215,6 +1140,204 @@ class RoleButtons(commands.Cog):
 
         return embed
 
+    def _invalid(self, ctx, field: str) -> str:
+        """Get error message of invalid field of imported configuration.
+
+        Args:
+            ctx: Command context
+            field: Path to the field
+
+        Returns:
+            Error message
+        """
+        return _(ctx, "Invalid value of {field}.").format(field=field)
+
+    def _parse_restrictions(self, ctx, raw, errors: List[str]) -> List[Tuple]:
+        """Validate restrictions of imported configuration.
+
+        Args:
+            ctx: Command context
+            raw: Decoded list of restrictions
+            errors: List the errors are appended to
+
+        Returns:
+            List of tuples of role ID and :class:`RestrictionType`
+        """
+        restrictions = []
+
+        if not isinstance(raw, list):
+            errors.append(self._invalid(ctx, "restrictions"))
+            return restrictions
+
+        for i, raw_restriction in enumerate(raw):
+            try:
+                role_id = int(raw_restriction["role_id"])
+                type = RestrictionType[raw_restriction["type"]]
+            except (KeyError, TypeError, ValueError):
+                errors.append(self._invalid(ctx, f"restrictions[{i}]"))
+                continue
+            if role_id in [restriction[0] for restriction in restrictions]:
+                errors.append(self._invalid(ctx, f"restrictions[{i}]"))
+                continue
+            if ctx.guild.get_role(role_id) is None:
+                errors.append(_(ctx, "Role {id} not found.").format(id=role_id))
+            restrictions.append((role_id, type))
+
+        return restrictions
+
+    def _parse_items(self, ctx, field: str, raw, errors: List[str]) -> List[Tuple]:
+        """Validate items of option of imported configuration.
+
+        Args:
+            ctx: Command context
+            field: Path to the items
+            raw: Decoded list of items
+            errors: List the errors are appended to
+
+        Returns:
+            List of tuples of Discord ID and :class:`DiscordType`
+        """
+        items = []
+
+        if not isinstance(raw, list):
+            errors.append(self._invalid(ctx, field))
+            return items
+
+        for i, raw_item in enumerate(raw):
+            try:
+                discord_id = int(raw_item["discord_id"])
+                discord_type = DiscordType[raw_item["type"]]
+            except (KeyError, TypeError, ValueError):
+                errors.append(self._invalid(ctx, f"{field}[{i}]"))
+                continue
+            if discord_id in [item[0] for item in items]:
+                errors.append(self._invalid(ctx, f"{field}[{i}]"))
+                continue
+            found = (
+                ctx.guild.get_role(discord_id)
+                if discord_type == DiscordType.ROLE
+                else ctx.guild.get_channel(discord_id)
+            )
+            if found is None:
+                errors.append(
+                    _(ctx, "Role or channel {id} not found.").format(id=discord_id)
+                )
+            items.append((discord_id, discord_type))
+
+        return items
+
+    def _parse_option(self, ctx, field: str, raw, errors: List[str]) -> dict:
+        """Validate option of imported configuration.
+
+        Args:
+            ctx: Command context
+            field: Path to the option
+            raw: Decoded option
+            errors: List the errors are appended to
+
+        Returns:
+            Option accepted by :meth:`RBView.restore`
+        """
+        if not isinstance(raw, dict):
+            errors.append(self._invalid(ctx, field))
+            return {}
+
+        label = raw.get("label", None)
+        if not isinstance(label, str) or not 1 <= len(label) <= 100:
+            errors.append(self._invalid(ctx, f"{field}.label"))
+
+        description = raw.get("description", None)
+        if description is not None and (
+            not isinstance(description, str) or len(description) > 100
+        ):
+            errors.append(self._invalid(ctx, f"{field}.description"))
+
+        emoji = raw.get("emoji", None)
+        if emoji is not None and not isinstance(emoji, str):
+            errors.append(self._invalid(ctx, f"{field}.emoji"))
+        elif emoji is not None:
+            encoded = rbutils.emoji_encode(self.emojis, emoji)
+            if encoded is None or (
+                encoded.isdigit() and not self.emojis.get(int(encoded))
+            ):
+                errors.append(_(ctx, "Emoji {emoji} not found.").format(emoji=emoji))
+            emoji = encoded
+
+        order = raw.get("order", 0)
+        if not isinstance(order, int) or isinstance(order, bool):
+            errors.append(self._invalid(ctx, f"{field}.order"))
+
+        return {
+            "label": label,
+            "description": description,
+            "emoji": emoji,
+            "order": order,
+            "items": self._parse_items(
+                ctx, f"{field}.items", raw.get("items", []), errors
+            ),
+        }
+
+    def _parse_config(self, ctx, data) -> Tuple[Optional[dict], List[str]]:
+        """Validate imported View configuration (see :meth:`RBView.export`).
+
+        All roles, channels and emojis must exist.
+
+        Args:
+            ctx: Command context
+            data: Decoded JSON
+
+        Returns:
+            Configuration accepted by :meth:`RBView.restore`
+            (None if invalid) and list of errors
+        """
+        if not isinstance(data, dict):
+            return None, [self._invalid(ctx, "view")]
+
+        errors = []
+
+        unique = data.get("unique", False)
+        if not isinstance(unique, bool):
+            errors.append(self._invalid(ctx, "unique"))
+
+        mode = data.get("mode", ApplyMode.BUTTONS.name)
+        if mode not in ApplyMode.__members__:
+            errors.append(self._invalid(ctx, "mode"))
+
+        max_values = data.get("max_values", 1)
+        if (
+            not isinstance(max_values, int)
+            or isinstance(max_values, bool)
+            or not 1 <= max_values <= 25
+        ):
+            errors.append(self._invalid(ctx, "max_values"))
+        elif unique is True and max_values > 1:
+            errors.append(_(ctx, "Unique View allows only one selected option."))
+
+        restrictions = self._parse_restrictions(
+            ctx, data.get("restrictions", []), errors
+        )
+
+        raw_options = data.get("options", [])
+        if not isinstance(raw_options, list):
+            errors.append(self._invalid(ctx, "options"))
+            raw_options = []
+
+        options = [
+            self._parse_option(ctx, f"options[{i}]", raw, errors)
+            for i, raw in enumerate(raw_options)
+        ]
+
+        if errors:
+            return None, errors
+
+        return {
+            "unique": unique,
+            "mode": ApplyMode[mode],
+            "max_values": max_values,
+            "restrictions": restrictions,
+            "options": options,
+        }, errors
+
     async def _get_view_roles(self, ctx, view: RBView) -> Dict[RestrictionType, str]:
         """Create dict where key is RestrictionType and values are lists
         of strings representing role names.
@@ -297,9 +1420,104 @@ class RoleButtons(commands.Cog):
         """Reload all Views and re-attach them
         to their messages.
         """
-        self._unload_views()
-        self.load_views.start()
-        await ctx.send(_(ctx, "All Views reloaded."))
+        self._unload_views()
+        self.load_views.start()
+        await ctx.send(_(ctx, "All Views reloaded."))
+
+    @check.acl2(check.ACLevel.MOD)
+    @rolebuttons_.command(name="cache")
+    async def rolebuttons_cache(self, ctx):
+        """Show statistics of selected options cache."""
+        embed = utils.discord.create_embed(
+            author=ctx.author, title=_(ctx, "Selection cache")
+        )
+
+        embed.add_field(
+            name=_(ctx, "Size"),
+            value="{size}/{maxsize}".format(
+                size=len(self.selections), maxsize=self.selections.maxsize
+            ),
+            inline=True,
+        )
+        embed.add_field(
+            name=_(ctx, "Expiration"),
+            value="{ttl:.0f} s".format(ttl=self.selections.ttl),
+            inline=True,
+        )
+        embed.add_field(name=_(ctx, "Hits"), value=self.selections.hits, inline=True)
+        embed.add_field(
+            name=_(ctx, "Misses"), value=self.selections.misses, inline=True
+        )
+        embed.add_field(
+            name=_(ctx, "Evictions"), value=self.selections.evictions, inline=True
+        )
+        embed.add_field(
+            name=_(ctx, "Expirations"), value=self.selections.expirations, inline=True
+        )
+
+        await ctx.send(embed=embed)
+
+    @check.acl2(check.ACLevel.MOD)
+    @rolebuttons_.group(name="limit")
+    async def rolebuttons_limit_(self, ctx):
+        await utils.discord.send_help(ctx)
+
+    @check.acl2(check.ACLevel.MOD)
+    @rolebuttons_limit_.command(name="list")
+    async def rolebuttons_limit_list(self, ctx):
+        """List limits shared by all guilds."""
+        items = []
+
+        for name, default in LIMITS.items():
+            dummy = ItemDummy()
+            dummy.name = name
+            dummy.value = getattr(self, name)
+            dummy.default = default
+            items.append(dummy)
+
+        tables = utils.text.create_table(
+            items,
+            {
+                "name": _(ctx, "Limit"),
+                "value": _(ctx, "Value"),
+                "default": _(ctx, "Default"),
+            },
+        )
+        for table in tables:
+            await ctx.send("```" + table + "```")
+
+    @check.acl2(check.ACLevel.BOT_OWNER)
+    @rolebuttons_limit_.command(name="set")
+    async def rolebuttons_limit_set(self, ctx, name: str, value: float):
+        """Set limit shared by all guilds.
+
+        Intervals and expirations are in seconds.
+
+        Args:
+            name: Name of limit
+            value: Positive value of limit
+        """
+        if name not in LIMITS:
+            await ctx.reply(_(ctx, "Limit {name} not found.").format(name=name))
+            return
+
+        value = type(LIMITS[name])(value)
+        if value <= 0:
+            await ctx.reply(_(ctx, "Limit has to be positive."))
+            return
+
+        storage.set(self, 0, key=name, value=value)
+        setattr(self, name, value)
+        self._apply_limits()
+
+        await bot_log.info(
+            ctx.author,
+            ctx.channel,
+            f"RoleButtons limit {name} set to {value}.",
+        )
+        await ctx.reply(
+            _(ctx, "Limit {name} set to {value}.").format(name=name, value=value)
+        )
 
     @check.acl2(check.ACLevel.MOD)
     @rolebuttons_.command(name="create")
@@ -315,6 +1533,7 @@ class RoleButtons(commands.Cog):
         """
         view = RBView.create(ctx.guild, unique)
         if view:
+            self._load_view(view)
             await ctx.reply(
                 _(ctx, "RoleButtons View created with ID {id}").format(id=view.idx)
             )
@@ -356,9 +1575,7 @@ class RoleButtons(commands.Cog):
         if value is None:
             await ctx.send(_(ctx, "Deleting timed out."))
         elif value:
-            view_ui = self.views.pop(view.idx, None)
-            if view_ui is not None:
-                view_ui.stop()
+            self._unload_view(view.idx)
             view.delete()
             view.save()
             await ctx.send(_(ctx, "View ID {id} deleted.").format(id=view_id))
@@ -382,6 +1599,131 @@ class RoleButtons(commands.Cog):
 
         await ctx.send(embed=embed)
 
+    @check.acl2(check.ACLevel.MOD)
+    @rolebuttons_.command(name="stats")
+    async def rolebuttons_stats(self, ctx, view_id: int):
+        """Shows how many times were View's Options added and removed.
+
+        Args:
+            view_id: ID of View.
+        """
+        view = RBView.get(ctx.guild, view_id)
+        if view is None:
+            await ctx.reply(_(ctx, "View with ID {id} not found.").format(id=view_id))
+            return
+
+        if not view.options:
+            await ctx.reply(_(ctx, "View has no options."))
+            return
+
+        await self._flush_stats()
+        stats = RBOptionStats.get_by_view(view.idx)
+
+        items = []
+
+        for option in sorted(view.options, key=lambda x: (x.oid, x.label)):
+            stat = stats.get(option.idx, None)
+            dummy = ItemDummy()
+            dummy.idx = option.idx
+            dummy.label = option.label
+            dummy.added = stat.added if stat is not None else 0
+            dummy.removed = stat.removed if stat is not None else 0
+            items.append(dummy)
+
+        tables = utils.text.create_table(
+            items,
+            {
+                "idx": _(ctx, "ID"),
+                "label": _(ctx, "Label"),
+                "added": _(ctx, "Added"),
+                "removed": _(ctx, "Removed"),
+            },
+        )
+        for table in tables:
+            await ctx.send("```" + table + "```")
+
+    @check.acl2(check.ACLevel.MOD)
+    @rolebuttons_.command(name="export")
+    async def rolebuttons_export(self, ctx, view_id: int):
+        """Export View's configuration (options, items and restrictions)
+        to JSON file, which can be imported by `rolebuttons import`.
+
+        Args:
+            view_id: ID of View.
+        """
+        view = RBView.get(ctx.guild, view_id)
+        if view is None:
+            await ctx.reply(_(ctx, "View with ID {id} not found.").format(id=view_id))
+            return
+
+        file = tempfile.TemporaryFile(mode="w+")
+        json.dump(view.export(), file, indent=4, ensure_ascii=False)
+
+        file.seek(0)
+        await ctx.reply(
+            _(ctx, "View with ID {id} exported to JSON.").format(id=view_id),
+            file=discord.File(fp=file, filename=f"rolebuttons-view-{view_id}.json"),
+        )
+        file.close()
+
+    @check.acl2(check.ACLevel.MOD)
+    @rolebuttons_.command(name="import")
+    async def rolebuttons_import(self, ctx, view_id: Optional[int] = None):
+        """Import View's configuration from attached JSON file.
+
+        Whole configuration is validated first and saved at once.
+        If View ID is provided, it's options and restrictions are replaced,
+        otherwise new View is created.
+
+        Args:
+            view_id: ID of View to replace (optional)
+        """
+        if len(ctx.message.attachments) != 1 or not ctx.message.attachments[
+            0
+        ].filename.lower().endswith("json"):
+            await ctx.reply(_(ctx, "You must attach one JSON file."))
+            return
+
+        view = None
+        if view_id is not None:
+            view = RBView.get(ctx.guild, view_id)
+            if view is None:
+                await ctx.reply(
+                    _(ctx, "View with ID {id} not found.").format(id=view_id)
+                )
+                return
+
+        data_file = tempfile.TemporaryFile()
+        await ctx.message.attachments[0].save(data_file)
+        data_file.seek(0)
+
+        try:
+            data = json.loads(data_file.read().decode("utf-8"))
+        except (UnicodeDecodeError, ValueError):
+            await ctx.reply(_(ctx, "Attached file is not valid JSON."))
+            return
+        finally:
+            data_file.close()
+
+        config, errors = self._parse_config(ctx, data)
+        if config is None:
+            await ctx.reply(
+                _(ctx, "Configuration is not valid:")
+                + "\n"
+                + "\n".join(errors[:10])
+                + ("\n…" if len(errors) > 10 else "")
+            )
+            return
+
+        view = RBView.restore(ctx.guild, config, view)
+        await self._refresh_view(ctx.guild, view.idx)
+
+        await ctx.reply(
+            _(ctx, "View with ID {id} imported with {options} options.").format(
+                id=view.idx, options=len(config["options"])
+            )
+        )
+
     @check.acl2(check.ACLevel.MOD)
     @rolebuttons_.group(name="option")
     async def rolebuttons_option_(self, ctx):
@@ -460,10 +1802,13 @@ class RoleButtons(commands.Cog):
             view_id=view_id,
             label=label,
             description=description,
-            emoji=rbutils.emoji_encode(self.bot, emoji) if emoji is not None else None,
+            emoji=rbutils.emoji_encode(self.emojis, emoji)
+            if emoji is not None
+            else None,
         )
 
         view.add_option(option)
+        await self._refresh_view(ctx.guild, view.idx)
 
         await ctx.send(_(ctx, "Option added with ID {id}.").format(id=option.idx))
 
@@ -485,6 +1830,7 @@ class RoleButtons(commands.Cog):
 
         option.oid = order
         option.save()
+        await self._refresh_view(ctx.guild, option.view_id)
 
         await ctx.send(
             _(ctx, "Set order {order} for Option ID {id}.").format(
@@ -524,10 +1870,11 @@ class RoleButtons(commands.Cog):
         option.label = label
         option.description = description
         option.emoji = (
-            rbutils.emoji_encode(self.bot, emoji) if emoji is not None else None
+            rbutils.emoji_encode(self.emojis, emoji) if emoji is not None else None
         )
 
         option.save()
+        await self._refresh_view(ctx.guild, option.view_id)
 
         await ctx.send(_(ctx, "Option with ID {id} edited.").format(id=option.idx))
 
@@ -555,7 +1902,9 @@ class RoleButtons(commands.Cog):
         if value is None:
             await ctx.send(_(ctx, "Deleting timed out."))
         elif value:
+            view_id = option.view_id
             option.delete()
+            await self._refresh_view(ctx.guild, view_id)
             await ctx.send(_(ctx, "Option with ID {id} deleted.").format(id=option_id))
         else:
             await ctx.send(_(ctx, "Deleting aborted."))
@@ -571,16 +1920,21 @@ class RoleButtons(commands.Cog):
         self,
         ctx,
         option_id: int,
-        dc_item: Union[discord.Role, discord.abc.GuildChannel],
+        *dc_items: Union[discord.Role, discord.abc.GuildChannel],
     ):
-        """Add role or channel to option.
+        """Add roles or channels to option.
 
         Channel can be TextChannel, VoiceChannel, Stage or Category.
+        Items already assigned to the option are skipped.
 
         Args:
             option_id: ID of Option
-            dc_item: Mentioned Role or Channel.
+            dc_items: Mentioned Roles or Channels.
         """
+        if not dc_items:
+            await utils.discord.send_help(ctx)
+            return
+
         option = RBOption.get(ctx.guild, option_id)
         if option is None:
             await ctx.reply(
@@ -588,21 +1942,44 @@ class RoleButtons(commands.Cog):
             )
             return
 
-        type = (
-            DiscordType.ROLE
-            if isinstance(dc_item, discord.Role)
-            else DiscordType.CHANNEL
-        )
+        existing = {item.discord_id for item in option.items}
+        added = []
+        skipped = []
 
-        item = RBItem(discord_id=dc_item.id, discord_type=type)
+        for dc_item in dc_items:
+            if dc_item.id in existing:
+                skipped.append(dc_item)
+                continue
+            existing.add(dc_item.id)
+            added.append(dc_item)
+
+        if added:
+            option.add_items(
+                [
+                    RBItem(
+                        discord_id=dc_item.id,
+                        discord_type=DiscordType.ROLE
+                        if isinstance(dc_item, discord.Role)
+                        else DiscordType.CHANNEL,
+                    )
+                    for dc_item in added
+                ]
+            )
+            await self._refresh_view(ctx.guild, option.view_id)
 
-        option.add_item(item)
+            await ctx.send(
+                _(ctx, "Items {names} added to Option ID {id}.").format(
+                    names=", ".join(dc_item.name for dc_item in added), id=option_id
+                )
+            )
 
-        await ctx.send(
-            _(ctx, "Item {name} added to Option ID {id}.").format(
-                name=dc_item.name, id=option_id
+        if skipped:
+            await ctx.send(
+                _(ctx, "Items {names} are already in Option ID {id}.").format(
+                    names=", ".join(dc_item.name for dc_item in skipped),
+                    id=option_id,
+                )
             )
-        )
 
     @check.acl2(check.ACLevel.MOD)
     @rolebuttons_.group(name="restriction")
@@ -636,6 +2013,7 @@ class RoleButtons(commands.Cog):
             return
 
         view.add_restriction(role, type)
+        await self._refresh_view(ctx.guild, view.idx)
 
         await ctx.send(
             _(ctx, "Restriction for role {name} added to View ID {id}.").format(
@@ -678,6 +2056,7 @@ class RoleButtons(commands.Cog):
             return
 
         view.remove_restriction(restriction)
+        await self._refresh_view(ctx.guild, view.idx)
 
         await ctx.send(
             _(
@@ -724,42 +2103,58 @@ class RoleButtons(commands.Cog):
         self,
         ctx,
         option_id: int,
-        dc_item: Union[discord.Role, discord.abc.GuildChannel, int],
+        *dc_items: Union[discord.Role, discord.abc.GuildChannel, int],
     ):
-        """Delete Option's items. Has to be confirmed."""
+        """Delete Option's items. Has to be confirmed.
+
+        Args:
+            option_id: ID of Option
+            dc_items: Mentioned Roles, Channels or their IDs.
+        """
+        if not dc_items:
+            await utils.discord.send_help(ctx)
+            return
+
         option = RBOption.get(ctx.guild, option_id)
         if option is None:
             await ctx.reply(
-                _(ctx, "Option with ID {id} not found.").format(id=dc_item.id)
+                _(ctx, "Option with ID {id} not found.").format(id=option_id)
             )
             return
 
-        if isinstance(dc_item, int):  # THIS SHOULD BE MOVED INTO CORE -> UTILS
-            role = discord.utils.get(ctx.guild.roles, id=dc_item)
-            if role:
-                dc_item = role
-            else:
-                channel = discord.utils.get(ctx.guild.channels, id=dc_item)
-                if channel is not None:
-                    dc_item = channel
-
-        dc_item_id = dc_item if isinstance(dc_item, int) else dc_item.id
-        dc_item_name = f"({dc_item})" if isinstance(dc_item, int) else dc_item.name
+        option_items = {item.discord_id: item for item in option.items}
+        items = []
+        names = []
+
+        for dc_item in dc_items:
+            if isinstance(dc_item, int):  # THIS SHOULD BE MOVED INTO CORE -> UTILS
+                dc_item = (
+                    ctx.guild.get_role(dc_item)
+                    or ctx.guild.get_channel(dc_item)
+                    or dc_item
+                )
 
-        items = [item for item in option.items if item.discord_id == dc_item_id]
+            dc_item_id = dc_item if isinstance(dc_item, int) else dc_item.id
+            dc_item_name = f"({dc_item})" if isinstance(dc_item, int) else dc_item.name
 
-        if len(items) != 1:
-            await ctx.reply(
-                _(ctx, "Item {name} in Option ID {id} not found.").format(
-                    name=dc_item_name, id=option_id
+            if dc_item_id not in option_items:
+                await ctx.reply(
+                    _(ctx, "Item {name} in Option ID {id} not found.").format(
+                        name=dc_item_name, id=option_id
+                    )
                 )
-            )
-            return
+                return
 
-        item = items[0]
+            if option_items[dc_item_id] not in items:
+                items.append(option_items[dc_item_id])
+                names.append(dc_item_name)
 
-        embed = await self._get_item_embed(ctx, option, item)
-        embed.title = _(ctx, "Do you want to delete this item?")
+        embed = await self._get_items_embed(ctx, option, items)
+        embed.title = (
+            _(ctx, "Do you want to delete this item?")
+            if len(items) == 1
+            else _(ctx, "Do you want to delete these items?")
+        )
 
         view = ConfirmView(ctx, embed)
         value = await view.send()
@@ -767,8 +2162,11 @@ class RoleButtons(commands.Cog):
         if value is None:
             await ctx.send(_(ctx, "Deleting timed out."))
         elif value:
-            item.delete()
-            await ctx.send(_(ctx, "Item {name} deleted.").format(name=dc_item_name))
+            option.remove_items(items)
+            await self._refresh_view(ctx.guild, option.view_id)
+            await ctx.send(
+                _(ctx, "Items {names} deleted.").format(names=", ".join(names))
+            )
         else:
             await ctx.send(_(ctx, "Deleting aborted."))
 
@@ -794,6 +2192,7 @@ class RoleButtons(commands.Cog):
 
         view.unique = unique
         view.save()
+        await self._refresh_view(ctx.guild, view.idx)
 
         await ctx.reply(
             _(ctx, "View with ID {id} changed to {type}").format(
@@ -801,6 +2200,77 @@ class RoleButtons(commands.Cog):
             )
         )
 
+    @check.acl2(check.ACLevel.MOD)
+    @rolebuttons_set_.command(name="mode")
+    async def rolebuttons_set_mode(self, ctx, view_id: int, mode: str):
+        """Changes how the selected option is applied.
+
+        BUTTONS: Option is selected and added / removed by buttons.
+        TOGGLE: Option is added or removed (if user has it) right after selection.
+        REPLACE: Option is added and all other options removed right after selection.
+
+        Args:
+            view_id: ID of View
+            mode: BUTTONS, TOGGLE or REPLACE
+        """
+        modes = [apply_mode.name for apply_mode in ApplyMode]
+        if mode not in modes:
+            await ctx.reply(
+                _(ctx, "Mode must be one of these: {modes}.").format(
+                    modes=", ".join(modes)
+                )
+            )
+            return
+
+        view = RBView.get(ctx.guild, view_id)
+        if view is None:
+            await ctx.reply(_(ctx, "View with ID {id} not found.").format(id=view_id))
+            return
+
+        view.mode = ApplyMode[mode]
+        view.save()
+        await self._refresh_view(ctx.guild, view.idx)
+
+        await ctx.reply(
+            _(ctx, "View with ID {id} changed to mode {mode}.").format(
+                id=view_id, mode=mode
+            )
+        )
+
+    @check.acl2(check.ACLevel.MOD)
+    @rolebuttons_set_.command(name="max")
+    async def rolebuttons_set_max(self, ctx, view_id: int, max_values: int):
+        """Changes how many options can be selected at once.
+
+        Unique View always allows only one option.
+
+        Args:
+            view_id: ID of View
+            max_values: Number of options (1-25)
+        """
+        if max_values < 1 or max_values > 25:
+            await ctx.reply(_(ctx, "Maximum must be between 1 and 25."))
+            return
+
+        view = RBView.get(ctx.guild, view_id)
+        if view is None:
+            await ctx.reply(_(ctx, "View with ID {id} not found.").format(id=view_id))
+            return
+
+        if view.unique and max_values > 1:
+            await ctx.reply(_(ctx, "Unique View allows only one selected option."))
+            return
+
+        view.max_values = max_values
+        view.save()
+        await self._refresh_view(ctx.guild, view.idx)
+
+        await ctx.reply(
+            _(ctx, "View with ID {id} allows {max} selected options.").format(
+                id=view_id, max=max_values
+            )
+        )
+
     @check.acl2(check.ACLevel.MOD)
     @rolebuttons_.group(name="message")
     async def rolebuttons_message_(self, ctx):
@@ -828,9 +2298,9 @@ class RoleButtons(commands.Cog):
             await ctx.reply(_(ctx, "View with ID {id} not loaded.").format(id=view_id))
             return
 
-        view = self.views[view_id]
+        compiled = self.views[view_id]
 
-        if view.view.guild_id != ctx.guild.id:
+        if compiled.view.guild_id != ctx.guild.id:
             await ctx.reply(_(ctx, "View with ID {id} not found.").format(id=view_id))
             return
 
@@ -848,12 +2318,14 @@ class RoleButtons(commands.Cog):
             await ctx.reply(_(ctx, "Message author must be bot."))
             return
 
-        view.view.add_message(message)
-        await message.edit(view=view)
+        view = RBView.get(ctx.guild, view_id)
+        view.add_message(message)
+        compiled = self._load_view(view)
+        await message.edit(view=compiled.render())
 
         await ctx.reply(
             _(ctx, "View with ID {view_id} attached to message {message_id}").format(
-                view_id=view.view.idx, message_id=message.id
+                view_id=compiled.view.idx, message_id=message.id
             )
         )
 
@@ -881,6 +2353,7 @@ class RoleButtons(commands.Cog):
 
         view = rbmessage.rbview
         view.remove_message(rbmessage)
+        self._load_view(view)
 
         if message is None:
             await ctx.reply(
@@ -894,6 +2367,238 @@ class RoleButtons(commands.Cog):
 
         await ctx.reply(_(ctx, "Message with ID {id} detached.").format(id=message_id))
 
+    @check.acl2(check.ACLevel.MOD)
+    @rolebuttons_.group(name="access")
+    async def rolebuttons_access_(self, ctx):
+        await utils.discord.send_help(ctx)
+
+    @check.acl2(check.ACLevel.MOD)
+    @rolebuttons_access_.command(name="list")
+    async def rolebuttons_access_list(self, ctx):
+        """List channels granted by access roles."""
+        access_roles = RBAccessRole.get_all(ctx.guild)
+
+        if not access_roles:
+            await ctx.reply(_(ctx, "No access roles found."))
+            return
+
+        items = []
+
+        for access_role in access_roles:
+            channel = ctx.guild.get_channel(access_role.channel_id)
+            role = ctx.guild.get_role(access_role.role_id)
+            dummy = ItemDummy()
+            dummy.channel = (
+                channel.name if channel else "({})".format(access_role.channel_id)
+            )
+            dummy.role = role.name if role else "({})".format(access_role.role_id)
+            items.append(dummy)
+
+        tables = utils.text.create_table(
+            items,
+            {
+                "channel": _(ctx, "Channel"),
+                "role": _(ctx, "Role"),
+            },
+        )
+        for table in tables:
+            await ctx.send("```" + table + "```")
+
+    @check.acl2(check.ACLevel.MOD)
+    @rolebuttons_access_.command(name="migrate")
+    async def rolebuttons_access_migrate(self, ctx, view_id: int):
+        """Grant View's channels by access roles.
+
+        Each channel of View's options gets bot-managed role
+        with single permission overwrite. Existing member overwrites
+        of those channels are converted to the roles.
+
+        Args:
+            view_id: ID of View
+        """
+        view = RBView.get(ctx.guild, view_id)
+        if view is None:
+            await ctx.reply(_(ctx, "View with ID {id} not found.").format(id=view_id))
+            return
+
+        channel_ids = {
+            item.discord_id
+            for option in view.options
+            for item in option.items
+            if item.discord_type == DiscordType.CHANNEL
+        }
+        channels = [
+            channel
+            for channel in [ctx.guild.get_channel(id) for id in channel_ids]
+            if channel is not None
+        ]
+
+        async with ctx.typing():
+            try:
+                converted, skipped = await self._migrate_access(channels)
+            except (discord.Forbidden, discord.HTTPException) as ex:
+                await guild_log.error(
+                    ctx.author,
+                    ctx.channel,
+                    "Exception occured during migrating RoleButtons access roles.",
+                    exception=ex,
+                )
+                await ctx.reply(_(ctx, "Something went wrong."))
+                return
+            finally:
+                for compiled in self.views.values():
+                    if compiled.view.guild_id == ctx.guild.id:
+                        compiled.compile()
+
+        await ctx.reply(
+            _(
+                ctx,
+                "{channels} channels of View ID {id} migrated to access roles, {members} member overwrites converted.",
+            ).format(channels=len(channels), id=view_id, members=converted)
+        )
+        if skipped:
+            await ctx.send(
+                _(
+                    ctx,
+                    "{members} overwrites of members who are no longer on the server were skipped.",
+                ).format(members=skipped)
+            )
+
+    def _parse_time(self, value: Optional[str]) -> Optional[datetime.datetime]:
+        """Parse time in ISO format (e.g. `2023-01-31` or `2023-01-31T12:00`).
+
+        Args:
+            value: Time from command's argument
+
+        Returns:
+            Parsed time, None if there's no time
+
+        Raises:
+            ValueError: If the time is not in ISO format
+        """
+        if value is None:
+            return None
+        return datetime.datetime.fromisoformat(value)
+
+    async def _send_audit(
+        self,
+        ctx,
+        member_id: Optional[int] = None,
+        discord_id: Optional[int] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ):
+        """Send table of audit entries matching the filters.
+
+        Args:
+            member_id: ID of affected member
+            discord_id: ID of role or channel
+            since: Oldest time of entries (ISO format)
+            until: Newest time of entries (ISO format)
+        """
+        try:
+            since = self._parse_time(since)
+            until = self._parse_time(until)
+        except ValueError:
+            await ctx.reply(
+                _(ctx, "Time must be in format YYYY-MM-DD or YYYY-MM-DDTHH:MM.")
+            )
+            return
+
+        await self._flush_audit()
+        entries = RBAuditEntry.search(
+            ctx.guild, member_id, discord_id, since, until, self.audit_limit
+        )
+
+        if not entries:
+            await ctx.reply(_(ctx, "No audit entries found."))
+            return
+
+        items = []
+
+        for entry in entries:
+            member = ctx.guild.get_member(entry.member_id)
+            if entry.discord_type == DiscordType.ROLE:
+                dc_item = ctx.guild.get_role(entry.discord_id)
+            else:
+                dc_item = ctx.guild.get_channel(entry.discord_id)
+            dummy = ItemDummy()
+            dummy.time = utils.time.format_datetime(entry.timestamp)
+            dummy.member = (
+                member.display_name if member else "({})".format(entry.member_id)
+            )
+            dummy.item = dc_item.name if dc_item else "({})".format(entry.discord_id)
+            dummy.action = _(ctx, "Added") if entry.added else _(ctx, "Removed")
+            items.append(dummy)
+
+        tables = utils.text.create_table(
+            items,
+            {
+                "time": _(ctx, "Time"),
+                "member": _(ctx, "Member"),
+                "item": _(ctx, "Item"),
+                "action": _(ctx, "Action"),
+            },
+        )
+        for table in tables:
+            await ctx.send("```" + table + "```")
+
+    @check.acl2(check.ACLevel.MOD)
+    @rolebuttons_.group(name="audit")
+    async def rolebuttons_audit_(self, ctx):
+        await utils.discord.send_help(ctx)
+
+    @check.acl2(check.ACLevel.MOD)
+    @rolebuttons_audit_.command(name="list")
+    async def rolebuttons_audit_list(
+        self, ctx, since: Optional[str] = None, until: Optional[str] = None
+    ):
+        """Show newest roles and channels added and removed by RoleButtons.
+
+        Args:
+            since: Oldest time (YYYY-MM-DD or YYYY-MM-DDTHH:MM)
+            until: Newest time (YYYY-MM-DD or YYYY-MM-DDTHH:MM)
+        """
+        await self._send_audit(ctx, since=since, until=until)
+
+    @check.acl2(check.ACLevel.MOD)
+    @rolebuttons_audit_.command(name="member")
+    async def rolebuttons_audit_member(
+        self,
+        ctx,
+        member: Union[discord.Member, int],
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ):
+        """Show roles and channels added to and removed from member.
+
+        Args:
+            member: Member or it's ID
+            since: Oldest time (YYYY-MM-DD or YYYY-MM-DDTHH:MM)
+            until: Newest time (YYYY-MM-DD or YYYY-MM-DDTHH:MM)
+        """
+        member_id = member if isinstance(member, int) else member.id
+        await self._send_audit(ctx, member_id=member_id, since=since, until=until)
+
+    @check.acl2(check.ACLevel.MOD)
+    @rolebuttons_audit_.command(name="item")
+    async def rolebuttons_audit_item(
+        self,
+        ctx,
+        dc_item: Union[discord.Role, discord.abc.GuildChannel, int],
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ):
+        """Show who got or lost role or channel.
+
+        Args:
+            dc_item: Role, Channel or it's ID
+            since: Oldest time (YYYY-MM-DD or YYYY-MM-DDTHH:MM)
+            until: Newest time (YYYY-MM-DD or YYYY-MM-DDTHH:MM)
+        """
+        discord_id = dc_item if isinstance(dc_item, int) else dc_item.id
+        await self._send_audit(ctx, discord_id=discord_id, since=since, until=until)
+
 
 class ItemDummy:
     """
@@ -1,143 +1,1002 @@
 from __future__ import annotations
 
-from typing import List, Tuple
+import asyncio
+import datetime
+import re
+import time
+
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
 
 import discord
 
 from pie import i18n, logger
 
 from .database import (
+    ApplyMode,
+    DiscordType,
     RestrictionType,
+    RBItem,
+    RBMessage,
+    RBRestriction,
     RBView,
     RBOption,
-    RBItem,
 )
 
-from .utils import RBUtils as rbutils
+from .utils import EmojiIndex, ErrorReporter, RBUtils as rbutils
 
 _ = i18n.Translator("modules/fsi").translate
 guild_log = logger.Guild.logger()
 
+OPTIONS_PER_SELECT = 25
+MAX_ROWS = 5
+
+# Custom ID of view's components: rb_view_{view}:{action}[:{page or group}]
+CUSTOM_ID_REGEX = re.compile(r"^rb_view_(\d+):(select|add|remove|page)(?::(\d+))?$")
+
+
+@dataclass(frozen=True)
+class RBItemSnapshot:
+    """Immutable copy of RBItem DB object.
+
+    Attributes:
+        discord_id: ID of role or channel
+        discord_type: Type of Discord object
+    """
+
+    discord_id: int
+    discord_type: DiscordType
+
+    @staticmethod
+    def from_db(item: RBItem) -> RBItemSnapshot:
+        return RBItemSnapshot(
+            discord_id=item.discord_id, discord_type=item.discord_type
+        )
+
+
+@dataclass(frozen=True)
+class RBOptionSnapshot:
+    """Immutable copy of RBOption DB object and it's items.
+
+    Attributes:
+        idx: Option ID
+        oid: Order of option
+        label: Option's label
+        description: Option's description
+        emoji: Encoded emoji
+        items: Option's items
+    """
+
+    idx: int
+    oid: int
+    label: str
+    description: Optional[str]
+    emoji: Optional[str]
+    items: Tuple[RBItemSnapshot, ...]
+
+    @staticmethod
+    def from_db(option: RBOption) -> RBOptionSnapshot:
+        return RBOptionSnapshot(
+            idx=option.idx,
+            oid=option.oid,
+            label=option.label,
+            description=option.description,
+            emoji=option.emoji,
+            items=tuple(RBItemSnapshot.from_db(item) for item in option.items),
+        )
+
+
+@dataclass(frozen=True)
+class RBRestrictionSnapshot:
+    """Immutable copy of RBRestriction DB object.
+
+    Attributes:
+        role_id: ID of restricted role
+        type: Restriction type
+    """
+
+    role_id: int
+    type: RestrictionType
+
+    @staticmethod
+    def from_db(restriction: RBRestriction) -> RBRestrictionSnapshot:
+        return RBRestrictionSnapshot(role_id=restriction.role_id, type=restriction.type)
+
+
+@dataclass(frozen=True)
+class RBMessageSnapshot:
+    """Immutable copy of RBMessage DB object.
+
+    Attributes:
+        message_id: ID of message
+        channel_id: ID of message's channel
+    """
+
+    message_id: int
+    channel_id: int
+
+    @staticmethod
+    def from_db(message: RBMessage) -> RBMessageSnapshot:
+        return RBMessageSnapshot(
+            message_id=message.message_id, channel_id=message.channel_id
+        )
+
+
+@dataclass(frozen=True)
+class RBViewSnapshot:
+    """Immutable copy of RBView DB object with it's options,
+    restrictions and messages.
+
+    It's detached from the database session, so it can be used
+    without touching the database. It's replaced by new snapshot
+    every time the view's configuration changes.
+
+    Attributes:
+        idx: View ID
+        guild_id: ID of view's guild
+        unique: Whether the view is unique
+        mode: How the selected option is applied
+        max_values: Maximal number of selected options
+        options: View's options
+        restrictions: View's restrictions
+        messages: Messages the view is attached to
+    """
+
+    idx: int
+    guild_id: int
+    unique: bool
+    mode: ApplyMode
+    max_values: int
+    options: Tuple[RBOptionSnapshot, ...]
+    restrictions: Tuple[RBRestrictionSnapshot, ...]
+    messages: Tuple[RBMessageSnapshot, ...]
+
+    @staticmethod
+    def from_db(view: RBView) -> RBViewSnapshot:
+        """Copy RBView DB object.
+
+        Args:
+            view: RBView DB object
+
+        Returns:
+            Snapshot of the view
+        """
+        return RBViewSnapshot(
+            idx=view.idx,
+            guild_id=view.guild_id,
+            unique=bool(view.unique),
+            mode=view.mode if view.mode is not None else ApplyMode.BUTTONS,
+            max_values=view.max_values or 1,
+            options=tuple(RBOptionSnapshot.from_db(option) for option in view.options),
+            restrictions=tuple(
+                RBRestrictionSnapshot.from_db(restriction)
+                for restriction in view.restrictions
+            ),
+            messages=tuple(
+                RBMessageSnapshot.from_db(message) for message in view.messages
+            ),
+        )
+
+
+@dataclass(frozen=True)
+class RBOptionItems:
+    """Immutable IDs of roles and channels assigned to RBOption.
+    It's compiled when the view is loaded, so processing
+    of the interaction does not need to query the database.
+
+    Attributes:
+        roles: IDs of roles
+        channels: IDs of channels
+    """
+
+    roles: Tuple[int, ...]
+    channels: Tuple[int, ...]
+
+    @staticmethod
+    def from_option(
+        option: RBOptionSnapshot, access_roles: Mapping[int, int]
+    ) -> RBOptionItems:
+        """Compile snapshot of RBOption DB object.
+
+        Channels with access role are compiled as the access role.
+
+        Args:
+            option: Snapshot of RBOption DB object
+            access_roles: Mapping of channel ID and it's access role ID
+
+        Returns:
+            Compiled role and channel IDs of the option
+        """
+        roles, channels = rbutils.split_items(option.items)
+        roles += tuple(
+            access_roles[channel]
+            for channel in channels
+            if channel in access_roles and access_roles[channel] not in roles
+        )
+        channels = tuple(channel for channel in channels if channel not in access_roles)
+        return RBOptionItems(roles=roles, channels=channels)
+
+
+@dataclass(frozen=True)
+class RBOptionComplement:
+    """Immutable IDs of roles and channels managed by unique view,
+    except the ones assigned to one of it's options.
+    Those are removed from user when the option is added.
+
+    Attributes:
+        roles: IDs of roles
+        channels: IDs of channels
+    """
+
+    roles: FrozenSet[int]
+    channels: FrozenSet[int]
+
+
+class RBChange:
+    """Intended change of member's roles and channels.
+
+    Attributes:
+        add_roles: IDs of roles to add
+        remove_roles: IDs of roles to remove
+        add_channels: IDs of channels to add
+        remove_channels: IDs of channels to remove
+    """
+
+    __slots__ = ("add_roles", "remove_roles", "add_channels", "remove_channels")
+
+    def __init__(
+        self,
+        add_roles: Iterable[int] = (),
+        remove_roles: Iterable[int] = (),
+        add_channels: Iterable[int] = (),
+        remove_channels: Iterable[int] = (),
+    ):
+        self.add_roles: Set[int] = set(add_roles)
+        self.remove_roles: Set[int] = set(remove_roles) - self.add_roles
+        self.add_channels: Set[int] = set(add_channels)
+        self.remove_channels: Set[int] = set(remove_channels) - self.add_channels
+
+    def merge(self, change: RBChange):
+        """Merge later change into this one. Later change wins
+        when the same role or channel is both added and removed.
+
+        Args:
+            change: Later change
+        """
+        self.add_roles = (self.add_roles - change.remove_roles) | change.add_roles
+        self.remove_roles = (self.remove_roles - change.add_roles) | change.remove_roles
+        self.add_channels = (
+            self.add_channels - change.remove_channels
+        ) | change.add_channels
+        self.remove_channels = (
+            self.remove_channels - change.add_channels
+        ) | change.remove_channels
+
+
+class RBMemberQueue:
+    """Serializes RoleButtons operations of each member.
+
+    Changes submitted while member's previous change is being applied
+    are merged into one, so burst of clicks results in single
+    reconciliation of member's roles and channels.
+
+    Attributes:
+        pending: Merged changes and their waiting futures
+            for each (guild_id, member_id) combination
+        workers: Running worker tasks for each (guild_id, member_id) combination
+        reporter: Reporter collecting invalid role and channel IDs
+        audit: Queue of applied changes waiting for the audit table
+        access_roles: Mapping of channel ID and it's access role ID
+    """
+
+    def __init__(
+        self,
+        reporter: Optional[ErrorReporter] = None,
+        audit: Optional[AuditQueue] = None,
+        access_roles: Optional[Mapping[int, int]] = None,
+    ):
+        self.reporter = reporter if reporter is not None else ErrorReporter()
+        self.audit = audit if audit is not None else AuditQueue()
+        self.access_roles = access_roles if access_roles is not None else {}
+        self.pending: Dict[Tuple[int, int], Tuple[RBChange, List[asyncio.Future]]] = {}
+        self.workers: Dict[Tuple[int, int], asyncio.Task] = {}
+
+    async def submit(self, member: discord.Member, change: RBChange) -> bool:
+        """Submit change of member's roles and channels
+        and wait until it's applied.
+
+        Args:
+            member: Affected :class:`discord.Member`
+            change: Intended change
+
+        Returns:
+            True if no error, False if Exception was raised.
+        """
+        key = (member.guild.id, member.id)
+        future = asyncio.get_running_loop().create_future()
+
+        if key in self.pending:
+            pending, futures = self.pending[key]
+            pending.merge(change)
+            futures.append(future)
+        else:
+            self.pending[key] = (change, [future])
+
+        if key not in self.workers:
+            self.workers[key] = asyncio.create_task(self._work(key, member))
+
+        return await future
+
+    async def _work(self, key: Tuple[int, int], member: discord.Member):
+        """Apply pending changes of member until there's none left.
+
+        Args:
+            key: Tuple of Guild and Member ID
+            member: Affected :class:`discord.Member`
+        """
+        try:
+            while key in self.pending:
+                change, futures = self.pending.pop(key)
+                try:
+                    result = await self._apply(member, change)
+                except Exception as ex:
+                    for future in futures:
+                        if not future.done():
+                            future.set_exception(ex)
+                    continue
+
+                if result is not None:
+                    member = result
+                for future in futures:
+                    if not future.done():
+                        future.set_result(result is not None)
+        finally:
+            self.workers.pop(key, None)
+
+    def _audit_roles(self, member: discord.Member, role_ids: Set[int], added: bool):
+        """Queue roles added to or removed from member for audit.
+        Access roles are recorded as their channels.
+
+        Args:
+            member: Affected :class:`discord.Member`
+            role_ids: IDs of added or removed roles
+            added: True if the roles were added, False if removed
+        """
+        channels = {role: channel for channel, role in self.access_roles.items()}
+        self.audit.record(
+            member,
+            (role_id for role_id in role_ids if role_id not in channels),
+            DiscordType.ROLE,
+            added,
+        )
+        self.audit.record(
+            member,
+            (channels[role_id] for role_id in role_ids if role_id in channels),
+            DiscordType.CHANNEL,
+            added,
+        )
+
+    async def _apply(
+        self, member: discord.Member, change: RBChange
+    ) -> Optional[discord.Member]:
+        """Internal function to add and remove roles and permissions.
+
+        Member's final roles are computed up front and set by single
+        API call, which is skipped if the roles would not change.
+        Roles and channels actually added or removed are queued for audit.
+
+        Args:
+            member: Affected :class:`discord.Member`
+            change: Change to apply
+
+        Returns:
+            Updated :class:`discord.Member`, None if Exception was raised.
+        """
+        guild = member.guild
+        add_roles = await rbutils.get_roles(guild, change.add_roles, self.reporter)
+        add_channels = await rbutils.get_channels(
+            guild, change.add_channels, self.reporter
+        )
+        remove_channels = await rbutils.get_channels(
+            guild, change.remove_channels, self.reporter
+        )
+
+        current = [role for role in member.roles if not role.is_default()]
+        roles = [role for role in current if role.id not in change.remove_roles]
+        roles += [role for role in add_roles if role not in roles]
+
+        role_ids = {role.id for role in roles}
+        current_ids = {role.id for role in current}
+
+        try:
+            if role_ids != current_ids:
+                member = (
+                    await member.edit(roles=roles, reason="ReactionButtons") or member
+                )
+                self._audit_roles(member, role_ids - current_ids, True)
+                self._audit_roles(member, current_ids - role_ids, False)
+            for channel in remove_channels:
+                overwrites = channel.overwrites
+                if member not in overwrites or not overwrites[member].read_messages:
+                    continue
+                await channel.set_permissions(member, overwrite=None)
+                self.audit.record(member, (channel.id,), DiscordType.CHANNEL, False)
+            for channel in add_channels:
+                overwrites = channel.overwrites
+                if member in overwrites and overwrites[member].read_messages:
+                    continue
+                await channel.set_permissions(member, read_messages=True)
+                self.audit.record(member, (channel.id,), DiscordType.CHANNEL, True)
+            return member
+        except (discord.Forbidden, discord.HTTPException) as ex:
+            await guild_log.error(
+                member,
+                member.guild,
+                "Exception occured during processing items in ReactionButtons.",
+                exception=ex,
+            )
+            return None
+
+
+class SelectionCache:
+    """Bounded cache of selected options with expiration.
+
+    Options selected by member in message's selects (by page)
+    are kept here until Add or Remove button of the message is pressed.
+    Selection expires after `ttl` seconds without being used.
+    If the cache is full, least recently used selection is evicted.
+
+    Attributes:
+        ttl: Number of seconds after which unused selection expires
+        maxsize: Maximal number of stored selections
+        hits: Number of found selections
+        misses: Number of missing or expired selections
+        evictions: Number of selections evicted because the cache was full
+        expirations: Number of expired selections
+    """
+
+    def __init__(self, ttl: float = 900.0, maxsize: int = 10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._data: OrderedDict[Tuple[int, int], Tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Tuple[int, int], defval=None, refresh: bool = True) -> Any:
+        """Get value from cache by key and refresh it's expiration.
+
+        Args:
+            key: Tuple of Message and Member ID used as key
+            defval: Default value which is returned if there's no value in cache
+            refresh: Whether to refresh the expiration
+
+        Returns:
+            Selected value or default value
+        """
+        self._expire()
+
+        item = self._data.get(key, None)
+        if item is None:
+            self.misses += 1
+            return defval
+
+        value = item[1]
+        if refresh:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Tuple[int, int], value: Any):
+        """Store value in cache, evicting least recently used values
+        if the cache is full.
+
+        Args:
+            key: Tuple of Message and Member ID used as key
+            value: Selected value
+        """
+        self._expire()
+
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, ttl: float, maxsize: int):
+        """Change limits of the cache. Expiration of stored values
+        is shifted by the difference of `ttl`, so they stay ordered.
+
+        Args:
+            ttl: Number of seconds after which unused selection expires
+            maxsize: Maximal number of stored selections
+        """
+        shift = ttl - self.ttl
+        self.ttl = ttl
+        self.maxsize = maxsize
+        for key, (expires, value) in self._data.items():
+            self._data[key] = (expires + shift, value)
+
+        self._expire()
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def _expire(self):
+        """Remove expired values. Values are ordered by expiration,
+        so only the oldest ones have to be checked.
+        """
+        now = time.monotonic()
+        while self._data:
+            expires, _value = next(iter(self._data.values()))
+            if expires > now:
+                break
+            self._data.popitem(last=False)
+            self.expirations += 1
+
+
+class OptionCounter:
+    """In-memory counters of added and removed options.
+
+    Counting is done without touching the database, the counts
+    are periodically taken by :meth:`pop` and written in one batch
+    (see :meth:`RBOptionStats.increment`).
+    """
+
+    def __init__(self):
+        self._counts: Dict[int, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def record(self, view_id: int, added: Iterable[int], removed: Iterable[int]):
+        """Count added and removed options of view.
+
+        Args:
+            view_id: ID of View
+            added: IDs of added options
+            removed: IDs of removed options
+        """
+        for option_id in added:
+            self._counts.setdefault(option_id, [view_id, 0, 0])[1] += 1
+        for option_id in removed:
+            self._counts.setdefault(option_id, [view_id, 0, 0])[2] += 1
+
+    def pop(self) -> Dict[int, Tuple[int, int, int]]:
+        """Take all recorded counts and reset the counters.
+
+        Returns:
+            Mapping of option ID and tuple of view ID, added and removed count
+        """
+        counts, self._counts = self._counts, {}
+        return {option_id: tuple(count) for option_id, count in counts.items()}
+
+    def restore(self, counts: Mapping[int, Tuple[int, int, int]]):
+        """Return counts which could not be written back to the counters.
+
+        Args:
+            counts: Counts returned by :meth:`pop`
+        """
+        for option_id, (view_id, added, removed) in counts.items():
+            count = self._counts.setdefault(option_id, [view_id, 0, 0])
+            count[1] += added
+            count[2] += removed
+
+
+class AuditQueue:
+    """In-process queue of roles and channels added to and removed
+    from members, waiting to be inserted to the audit table.
+
+    Entries are taken by :meth:`pop` and inserted in batches
+    (see :meth:`RBAuditEntry.add_many`). If the queue is full,
+    the oldest entries are dropped.
+
+    Attributes:
+        maxsize: Maximal number of queued entries
+        dropped: Number of entries dropped because the queue was full
+    """
+
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._entries: Deque[dict] = deque()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def record(
+        self,
+        member: discord.Member,
+        discord_ids: Iterable[int],
+        discord_type: DiscordType,
+        added: bool,
+    ):
+        """Queue roles or channels added to or removed from member.
+
+        Args:
+            member: Affected :class:`discord.Member`
+            discord_ids: IDs of roles or channels
+            discord_type: Type of Discord objects
+            added: True if the items were added, False if removed
+        """
+        timestamp = datetime.datetime.now()
+        for discord_id in discord_ids:
+            self._entries.append(
+                {
+                    "guild_id": member.guild.id,
+                    "member_id": member.id,
+                    "discord_id": discord_id,
+                    "discord_type": discord_type,
+                    "added": added,
+                    "timestamp": timestamp,
+                }
+            )
+        self._trim()
+
+    def pop(self) -> List[dict]:
+        """Take all queued entries.
+
+        Returns:
+            List of mappings of entry's columns, from the oldest
+        """
+        entries, self._entries = list(self._entries), deque()
+        return entries
+
+    def restore(self, entries: List[dict]):
+        """Return entries which could not be inserted back to the queue.
+
+        Args:
+            entries: Entries returned by :meth:`pop`
+        """
+        self._entries.extendleft(reversed(entries))
+        self._trim()
+
+    def _trim(self):
+        """Drop the oldest entries if the queue is full."""
+        while len(self._entries) > self.maxsize:
+            self._entries.popleft()
+            self.dropped += 1
+
+
+class RBReverseIndex:
+    """Index of Discord IDs used by items and restrictions of loaded views.
+
+    It's used to find views affected by deleted role or channel
+    without querying the database.
+    """
+
+    def __init__(self):
+        self._refs: Dict[int, Set[Tuple[int, Optional[int]]]] = {}
+        self._views: Dict[int, Set[Tuple[int, Optional[int]]]] = {}
+
+    def update(self, view: RBViewSnapshot):
+        """Replace indexed references of view.
+
+        Args:
+            view: Snapshot of RBView DB object
+        """
+        self.remove(view.idx)
+
+        refs = {
+            (item.discord_id, option.idx)
+            for option in view.options
+            for item in option.items
+        }
+        refs.update((restriction.role_id, None) for restriction in view.restrictions)
+
+        self._views[view.idx] = refs
+        for discord_id, option_id in refs:
+            self._refs.setdefault(discord_id, set()).add((view.idx, option_id))
+
+    def remove(self, view_id: int):
+        """Remove indexed references of view.
+
+        Args:
+            view_id: ID of view
+        """
+        for discord_id, option_id in self._views.pop(view_id, ()):
+            refs = self._refs.get(discord_id, set())
+            refs.discard((view_id, option_id))
+            if not refs:
+                self._refs.pop(discord_id, None)
+
+    def get(self, discord_id: int) -> FrozenSet[Tuple[int, Optional[int]]]:
+        """Get views and options referencing role or channel.
+
+        Args:
+            discord_id: ID of role or channel
+
+        Returns:
+            Tuples of view ID and option ID (None for restrictions)
+        """
+        return frozenset(self._refs.get(discord_id, ()))
+
 
 class OptionDropdown(discord.ui.Select):
     """Implementation of NextCord Select object used in RBView.
-    It caches selected option for each combination of message and user,
-    so it can be get from RBView and used to add / remove roles.
+    It only renders options, selected values are processed
+    by :class:`RBCompiledView`.
 
     This can actually be generalized and used as core object in future.
-
-    Attributes:
-        cache: :class:`Dictionary` holding selected values for (message_id, user_id) combination.
     """
 
     def __init__(
-        self, bot: discord.Client, utx, custom_id: str, db_options: List[RBOption]
+        self,
+        emojis: EmojiIndex,
+        utx,
+        custom_id: str,
+        db_options: List[RBOptionSnapshot],
+        max_values: int = 1,
+        page: Optional[int] = None,
+        pages: int = 1,
+        min_values: int = 1,
     ):
-        """Inits SelectOptions based on list of RBOption DB objects.
+        """Inits SelectOptions based on list of RBOption snapshots.
 
         Args:
+            emojis: Index used to decode emojis
             utx: Translation context used for placeholder.
             custom_id: String used to identify Select
-            db_options: List of RBOption DB objects
+            db_options: List of RBOption snapshots
+            max_values: Maximal number of selected options
+            page: Index of page shown in placeholder (None if there's one page)
+            pages: Number of pages shown in placeholder
+            min_values: Minimal number of selected options
+                (0 allows to clear selection of the page)
         """
-        self.cache = {}
-
         options = []
 
         for db_option in db_options:
+            emoji = rbutils.emoji_decode(emojis, db_option.emoji)
+            if isinstance(emoji, str) and emoji.isdigit():
+                # Custom emoji of guild which is not available (yet)
+                emoji = None
             option = discord.SelectOption(
                 label=db_option.label,
                 description=db_option.description,
-                emoji=rbutils.emoji_decode(bot, db_option.emoji)
-                if db_option.emoji is not None
-                else None,
+                emoji=emoji,
                 value=db_option.idx,
             )
             options.append(option)
 
+        placeholder = _(utx, "Select role from list")
+        if page is not None:
+            placeholder += " ({page}/{pages})".format(page=page + 1, pages=pages)
+
         super().__init__(
-            placeholder=_(utx, "Select role from list"),
-            min_values=1,
-            max_values=1,
+            placeholder=placeholder,
+            min_values=min_values,
+            max_values=max(1, min(max_values, len(options))),
             options=options,
             custom_id=custom_id,
         )
 
-    def get(self, key: Tuple[int, int], defval) -> int:
-        """Get value from cache by key (touple of Message and Member ID)
 
-        Args:
-            key: Tuple of Message and Member ID used as key
-            defval: Default value which is returned if there's no value in cache
+class RBCompiledView:
+    """Compiled RBView snapshot which processes interactions of the view.
 
-        Returns:
-            Added/Updated config object
-        """
-        return self.cache.get(key, defval)
+    Interactions of all views are routed by the module (see :data:`CUSTOM_ID_REGEX`),
+    so there's no :class:`discord.ui.View` kept for each view.
+    The UI is rendered by :class:`RBViewUI` only when some
+    message has to be sent or edited.
 
-    async def callback(self, interaction: discord.Interaction):
-        self.cache[(interaction.message.id, interaction.user.id)] = self.values[0]
-        await interaction.response.defer()
+    The view works only with :class:`RBViewSnapshot`, so processing
+    of the interaction never touches the database.
 
-
-class RBViewUI(discord.ui.View):
-    """Persistant view used as UI for RoleButtons.
-    There's only one RBView UI for one RBView DB object.
-    Every instance is inicialized inside module and is
-    linked by custom_id of each of it's object.
-    This ID contains RBView DB object's unique ID which provides
-    persistnace between bot restarts.
-
-    This can actually be generalized and used as core object in future.
+    In direct modes (see :class:`ApplyMode`) there are no buttons
+    and the selected option is applied right away.
 
     Attributes:
-        utx: Translation context based on guild
-        dropdown: OptionDropdown used for getting selected option
+        emojis: Index used to decode emojis
+        view: Snapshot of RBView DB object
+        mode: How the selected option is applied
+        max_values: Maximal number of selected options
+        pages: Sorted options split by 25
+        select_rows: Number of OptionDropdowns rendered in one group
+        groups: Number of groups of pages
+        index: Immutable mapping of option ID and it's compiled items
+        complements: Immutable mapping of option ID and items of all other
+            options (only for unique views and views in REPLACE mode)
+        allowed_roles: IDs of roles allowed to use the view
+        disallowed_roles: IDs of roles disallowed to use the view
+        access_roles: Mapping of channel ID and it's access role ID
+        queue: Queue serializing changes of members
+        selections: Cache of selected options
+        counter: Counters of added and removed options
     """
 
-    def __init__(self, bot: discord.Client, view: RBView):
-        """Creates translation context based on guild settings.
-        Then inits OptionDropdown with all options user can choose,
-        and buttons for add / remove.
+    def __init__(
+        self,
+        emojis: EmojiIndex,
+        view: RBViewSnapshot,
+        access_roles: Optional[Mapping[int, int]] = None,
+        queue: Optional[RBMemberQueue] = None,
+        selections: Optional[SelectionCache] = None,
+        counter: Optional[OptionCounter] = None,
+    ):
+        """Compiles the view.
 
         Args:
-            view: RBView database object
+            emojis: Index used to decode emojis (shared by all views)
+            view: Snapshot of RBView DB object
+            access_roles: Mapping of channel ID and it's access role ID
+            queue: Queue serializing changes of members (shared by all views)
+            selections: Cache of selected options (shared by all views)
+            counter: Counters of added and removed options (shared by all views)
         """
+        self.emojis = emojis
+        self.access_roles = access_roles if access_roles is not None else {}
+        self.queue = queue if queue is not None else RBMemberQueue()
+        self.selections = selections if selections is not None else SelectionCache()
+        self.counter = counter if counter is not None else OptionCounter()
 
-        self.utx = i18n.TranslationContext(view.guild_id, None)
-        self.view = view
-        self.bot = bot
+        self.compile(view)
 
-        super().__init__(timeout=None)
+    def compile(self, view: Optional[RBViewSnapshot] = None):
+        """Compile layout and index of view's options.
+
+        It must be called with new snapshot every time the view's
+        configuration changes, or without snapshot when access roles change.
+        Everything is compiled first and swapped at once,
+        so interactions never see partially compiled view.
 
-        options = self.view.options
+        Options are paged by 25 into multiple OptionDropdowns.
+        If there's more pages than fits into one message, pages are split
+        into groups, which are switched by page buttons.
 
-        self.dropdown = OptionDropdown(
-            bot=self.bot,
-            utx=self.utx,
-            custom_id="rb_view_{}:select".format(self.view.idx),
-            db_options=sorted(options, key=lambda x: (x.oid, x.label), reverse=False),
+        Args:
+            view: New snapshot of RBView DB object (None keeps the current one)
+        """
+        if view is None:
+            view = self.view
+
+        mode = view.mode
+        max_values = 1 if view.unique else view.max_values
+
+        options = sorted(view.options, key=lambda x: (x.oid, x.label))
+        pages = [
+            options[i : i + OPTIONS_PER_SELECT]
+            for i in range(0, len(options), OPTIONS_PER_SELECT)
+        ] or [[]]
+
+        # Buttons share one row with page buttons, direct modes
+        # need the row only if there are more groups
+        select_rows = MAX_ROWS - 1
+        if mode != ApplyMode.BUTTONS and len(pages) <= MAX_ROWS:
+            select_rows = MAX_ROWS
+        groups = (len(pages) + select_rows - 1) // select_rows
+
+        index = MappingProxyType(
+            {
+                option.idx: RBOptionItems.from_option(option, self.access_roles)
+                for option in view.options
+            }
         )
 
-        self.add_item(self.dropdown)
+        complements = {}
+
+        if view.unique or mode == ApplyMode.REPLACE:
+            all_roles = frozenset(
+                role for option in index.values() for role in option.roles
+            )
+            all_channels = frozenset(
+                channel for option in index.values() for channel in option.channels
+            )
+            for idx, option in index.items():
+                complements[idx] = RBOptionComplement(
+                    roles=all_roles.difference(option.roles),
+                    channels=all_channels.difference(option.channels),
+                )
 
-        addBtn = discord.ui.Button(
-            label=_(self.utx, "Add"),
-            style=discord.ButtonStyle.green,
-            custom_id="rb_view_{}:add".format(self.view.idx),
+        allowed_roles = frozenset(
+            restriction.role_id
+            for restriction in view.restrictions
+            if restriction.type == RestrictionType.ALLOW
+        )
+        disallowed_roles = frozenset(
+            restriction.role_id
+            for restriction in view.restrictions
+            if restriction.type == RestrictionType.DISALLOW
         )
 
-        removeBtn = discord.ui.Button(
-            label=_(self.utx, "Remove"),
-            style=discord.ButtonStyle.red,
-            custom_id="rb_view_{}:remove".format(self.view.idx),
+        self.view: RBViewSnapshot = view
+        self.mode: ApplyMode = mode
+        self.max_values: int = max_values
+        self.pages: List[List[RBOptionSnapshot]] = pages
+        self.select_rows: int = select_rows
+        self.groups: int = groups
+        self.index: Mapping[int, RBOptionItems] = index
+        self.complements: Mapping[int, RBOptionComplement] = MappingProxyType(
+            complements
         )
+        self.allowed_roles: FrozenSet[int] = allowed_roles
+        self.disallowed_roles: FrozenSet[int] = disallowed_roles
+
+    def render(self, group: int = 0) -> RBViewUI:
+        """Render group of pages as :class:`discord.ui.View`.
+
+        Args:
+            group: Index of rendered group of pages
 
-        addBtn.callback = self.add
-        removeBtn.callback = self.remove
+        Returns:
+            Rendered view
+        """
+        return RBViewUI(self, max(0, min(group, self.groups - 1)))
+
+    async def dispatch(
+        self, interaction: discord.Interaction, action: str, arg: Optional[int]
+    ):
+        """Process interaction routed by it's custom_id.
+
+        Args:
+            interaction: :class:`discord.Interaction` object
+            action: Action parsed from custom_id (select, add, remove or page)
+            arg: Index of page (select) or group (page) parsed from custom_id
+        """
+        if action == "select":
+            values = tuple(interaction.data.get("values", ()))
+            if self.mode == ApplyMode.BUTTONS:
+                # Each page has it's own select, selections of all pages
+                # are combined when the button is pressed. If only one option
+                # can be selected, the latest selection replaces the others.
+                key = (interaction.message.id, interaction.user.id)
+                selected = {}
+                if self.max_values > 1:
+                    selected = dict(self.selections.get(key, None) or {})
+                selected[arg or 0] = values
+                if not values:
+                    # Page was cleared
+                    del selected[arg or 0]
+                self.selections.set(key, selected)
+                await interaction.response.defer()
+            else:
+                await self.select(interaction, (arg or 0) // self.select_rows, values)
+        elif action == "add":
+            await self._process(interaction, add_items=True)
+        elif action == "remove":
+            await self._process(interaction, add_items=False)
+        elif action == "page":
+            await self.page(arg or 0, interaction)
+
+    async def page(self, group: int, interaction: discord.Interaction):
+        """Page button handler. Shows group of pages
+        as ephemeral message or switches the group if it's already shown.
+
+        Args:
+            group: Index of shown group of pages
+            interaction: :class:`discord.Interaction` object
+        """
+        view_ui = self.render(group)
+        ctx = i18n.TranslationContext(interaction.guild_id, interaction.user.id)
+        content = _(ctx, "Page {page}/{pages}").format(
+            page=view_ui.group + 1, pages=self.groups
+        )
 
-        self.add_item(addBtn)
-        self.add_item(removeBtn)
+        if interaction.message is not None and interaction.message.flags.ephemeral:
+            await interaction.response.edit_message(content=content, view=view_ui)
+        else:
+            await interaction.response.send_message(
+                content=content, view=view_ui, ephemeral=True
+            )
 
     async def _check_restrict(self, interaction: discord.Interaction):
         """Checks if user has one of allowed roles (if there are any)
@@ -157,37 +1016,83 @@ class RBViewUI(discord.ui.View):
         if not isinstance(interaction.user, discord.Member):
             return False
 
-        if not self.view.restrictions:
-            return True
-
-        user = interaction.user
-        is_allowed = None
+        return rbutils.check_restrictions(
+            {role.id for role in interaction.user.roles},
+            self.allowed_roles,
+            self.disallowed_roles,
+        )
 
-        for restriction in self.view.restrictions:
-            if restriction.type == RestrictionType.DISALLOW:
-                if user.get_role(restriction.role_id):
-                    return False
-            else:
-                if user.get_role(restriction.role_id):
-                    is_allowed = True
-                elif not is_allowed:
-                    is_allowed = False
+    async def select(
+        self, interaction: discord.Interaction, group: int, values: Tuple[str, ...]
+    ):
+        """Select handler used in direct modes.
 
-        return True if is_allowed is None else is_allowed
+        In TOGGLE mode each selected option is removed if user already has it,
+        added otherwise. In REPLACE mode the selected options are added and
+        all other options are removed.
 
-    async def add(self, interaction: discord.Interaction):
-        """Button handler (callback) of button 'Add'
         Args:
             interaction: :class:`discord.Interaction` object
+            group: Index of group of pages the select belongs to
+            values: Selected values
         """
-        await self._process(interaction, add_items=True)
+        if not isinstance(interaction.user, discord.Member):
+            return
+
+        member = interaction.user
+        ctx = i18n.TranslationContext(member.guild.id, member.id)
+
+        if not await self._check_restrict(interaction):
+            await interaction.response.send_message(
+                _(ctx, "You don't have permissions to use this Reaction Buttons"),
+                ephemeral=True,
+            )
+            return
+
+        values = [int(value) for value in values]
+        add_values = values
+        remove_values = []
+
+        if self.mode == ApplyMode.TOGGLE:
+            empty = RBOptionItems(roles=(), channels=())
+            add_values = [
+                value
+                for value in values
+                if not self._has_option(member, self.index.get(value, empty))
+            ]
+            remove_values = [value for value in values if value not in add_values]
+
+        # Re-render the message to reset the selection
+        await interaction.response.edit_message(view=self.render(group))
+
+        await self._apply_options(interaction, add_values, remove_values)
+
+    def _has_option(self, member: discord.Member, option: RBOptionItems) -> bool:
+        """Check if member already has all roles and channels of the option.
 
-    async def remove(self, interaction: discord.Interaction):
-        """Button handler (callback) of button 'Remove'
         Args:
-            interaction: :class:`discord.Interaction` object
+            member: :class:`discord.Member` to check
+            option: Compiled option
+
+        Returns:
+            True if member has all option's items, False otherwise.
         """
-        await self._process(interaction, add_items=False)
+        if not option.roles and not option.channels:
+            return False
+
+        role_ids = {role.id for role in member.roles}
+        if not role_ids.issuperset(option.roles):
+            return False
+
+        for channel_id in option.channels:
+            channel = member.guild.get_channel(channel_id)
+            if channel is None:
+                continue
+            overwrite = channel.overwrites.get(member, None)
+            if overwrite is None or not overwrite.read_messages:
+                return False
+
+        return True
 
     async def _process(self, interaction: discord.Interaction, add_items: bool):
         """Internal function to process pressed button.
@@ -209,126 +1114,227 @@ class RBViewUI(discord.ui.View):
             )
             return
 
-        value = self.dropdown.get((interaction.message.id, interaction.user.id), None)
-        if value is None:
+        key = (interaction.message.id, interaction.user.id)
+        selected = self.selections.get(key, None, refresh=False)
+        values = list(
+            dict.fromkeys(
+                int(value)
+                for page in sorted(selected or {})
+                for value in selected[page]
+            )
+        )
+        if not values:
             await interaction.response.send_message(
                 _(ctx, "You must select option first."), ephemeral=True
             )
             return
 
+        if len(values) > self.max_values:
+            await interaction.response.send_message(
+                _(ctx, "You can select at most {max} options.").format(
+                    max=self.max_values
+                ),
+                ephemeral=True,
+            )
+            return
+
+        # Only accepted selection is kept alive
+        self.selections.set(key, selected)
         await interaction.response.defer()
 
-        items = RBItem.get_by_option(value)
+        if add_items:
+            await self._apply_options(interaction, values, [])
+        else:
+            await self._apply_options(interaction, [], values)
+
+    async def _apply_options(
+        self,
+        interaction: discord.Interaction,
+        add_values: List[int],
+        remove_values: List[int],
+    ):
+        """Internal function to add and remove options and inform user.
+        All options are merged into single change of member's roles and channels.
+        Interaction must be already responded.
 
-        roles, channels = await rbutils.process_items(items, guild)
+        Args:
+            interaction: :class:`discord.Interaction` object
+            add_values: IDs of options to add
+            remove_values: IDs of options to remove
+        """
+        member = interaction.user
+        ctx = i18n.TranslationContext(member.guild.id, member.id)
+        empty = RBOptionItems(roles=(), channels=())
+        add_options = [self.index.get(value, empty) for value in add_values]
+        remove_options = [self.index.get(value, empty) for value in remove_values]
 
-        if add_items:
-            if self.view.unique:
-                r_roles = set()
-                r_channels = set()
-                for option in self.view.options:
-                    p_roles, p_items = await rbutils.process_items(option.items, guild)
-                    r_roles.update(p_roles)
-                    r_channels.update(p_items)
-
-                remove_roles = r_roles.difference(roles)
-                remove_channels = r_channels.difference(channels)
-                await self._remove_items(
-                    member,
-                    [role for role in remove_roles if role in member.roles],
-                    remove_channels,
-                )
+        change = RBChange(
+            remove_roles=(role for option in remove_options for role in option.roles),
+            remove_channels=(
+                channel for option in remove_options for channel in option.channels
+            ),
+        )
 
-            if await self._add_items(member, roles, channels):
-                await interaction.followup.send(
-                    content=_(ctx, "Roles and channels successfuly added."),
-                    ephemeral=True,
-                )
-            else:
-                await interaction.followup.send(
-                    content=_(ctx, "Something went wrong."),
-                    ephemeral=True,
+        # Everything managed by view except the added options
+        complements = [
+            self.complements[value] for value in add_values if value in self.complements
+        ]
+        if complements:
+            change.merge(
+                RBChange(
+                    remove_roles=frozenset.intersection(
+                        *[complement.roles for complement in complements]
+                    ),
+                    remove_channels=frozenset.intersection(
+                        *[complement.channels for complement in complements]
+                    ),
                 )
+            )
+
+        change.merge(
+            RBChange(
+                add_roles=(role for option in add_options for role in option.roles),
+                add_channels=(
+                    channel for option in add_options for channel in option.channels
+                ),
+            )
+        )
+
+        if not await self.queue.submit(member, change):
+            await interaction.followup.send(
+                content=_(ctx, "Something went wrong."),
+                ephemeral=True,
+            )
+            return
+
+        self.counter.record(
+            self.view.idx,
+            (value for value in add_values if value in self.index),
+            (value for value in remove_values if value in self.index),
+        )
+
+        if not remove_values:
+            await interaction.followup.send(
+                content=_(ctx, "Roles and channels successfuly added."),
+                ephemeral=True,
+            )
+        elif not add_values:
+            await interaction.followup.send(
+                content=_(ctx, "Roles and channels successfuly removed."),
+                ephemeral=True,
+            )
         else:
-            if await self._remove_items(member, roles, channels):
-                await interaction.followup.send(
-                    content=_(ctx, "Roles and channels successfuly removed."),
-                    ephemeral=True,
-                )
-            else:
-                await interaction.followup.send(
-                    content=_(ctx, "Something went wrong."),
-                    ephemeral=True,
-                )
+            await interaction.followup.send(
+                content=_(ctx, "Roles and channels successfuly updated."),
+                ephemeral=True,
+            )
 
-    async def _add_items(
-        self,
-        member: discord.Member,
-        roles: List[discord.Role],
-        channels: List[discord.abc.GuildChannel],
-    ) -> bool:
-        """Internal function to add roles and permissions.
-        Args:
-            member: Affected :class:`discord.Member`
-            roles: List of :class:`discord.Role` to add
-            channels: List of :class:`discord.abc.GuildChannel` to add
 
-        Returns:
-            True if no error, False if Exception was raised.
+class RBViewUI(discord.ui.View):
+    """View used as UI for RoleButtons.
+    It's linked with :class:`RBCompiledView` by custom_id of each of it's object.
+    This ID contains RBView DB object's unique ID which provides
+    persistnace between bot restarts.
+
+    The view is only rendered, it's stopped right after creation so it's not
+    kept by the bot. Interactions are routed by the module to the compiled view.
+
+    Attributes:
+        utx: Translation context based on guild
+        compiled: Rendered compiled view
+        group: Index of rendered group of pages
+        dropdowns: Rendered OptionDropdowns
+    """
+
+    def __init__(self, compiled: RBCompiledView, group: int = 0):
+        """Creates translation context based on guild settings.
+        Then inits OptionDropdowns with options user can choose,
+        and buttons for add / remove and page buttons.
+
+        Args:
+            compiled: Compiled view
+            group: Index of rendered group of pages
         """
-        for role in member.roles:
-            if role in roles:
-                roles.remove(role)
+        view = compiled.view
 
-        try:
-            await member.add_roles(*roles, reason="ReactionButtons")
-            for channel in channels:
-                overwrites = channel.overwrites
-                if member in overwrites and overwrites[member].read_messages:
-                    continue
-                await channel.set_permissions(member, read_messages=True)
-            return True
-        except (discord.Forbidden, discord.HTTPException) as ex:
-            await guild_log.error(
-                member,
-                member.guild,
-                "Exception occured during removing items in ReactionButtons.",
-                exception=ex,
+        self.utx = i18n.TranslationContext(view.guild_id, None)
+        self.compiled = compiled
+        self.group = group
+
+        super().__init__(timeout=None)
+
+        pages = compiled.pages
+        self.dropdowns: List[OptionDropdown] = []
+
+        first_page = group * compiled.select_rows
+        for page in range(
+            first_page, min(first_page + compiled.select_rows, len(pages))
+        ):
+            dropdown = OptionDropdown(
+                emojis=compiled.emojis,
+                utx=self.utx,
+                custom_id=self._select_id(page),
+                db_options=pages[page],
+                max_values=compiled.max_values,
+                page=page if len(pages) > 1 else None,
+                pages=len(pages),
+                # Selection of page can be cleared if it's combined with others
+                min_values=0
+                if compiled.mode == ApplyMode.BUTTONS and len(pages) > 1
+                else 1,
             )
-            return False
+            self.dropdowns.append(dropdown)
+            self.add_item(dropdown)
+
+        if compiled.mode == ApplyMode.BUTTONS:
+            addBtn = discord.ui.Button(
+                label=_(self.utx, "Add"),
+                style=discord.ButtonStyle.green,
+                custom_id="rb_view_{}:add".format(view.idx),
+                row=MAX_ROWS - 1,
+            )
+
+            removeBtn = discord.ui.Button(
+                label=_(self.utx, "Remove"),
+                style=discord.ButtonStyle.red,
+                custom_id="rb_view_{}:remove".format(view.idx),
+                row=MAX_ROWS - 1,
+            )
+
+            self.add_item(addBtn)
+            self.add_item(removeBtn)
+
+        if group > 0:
+            prevBtn = discord.ui.Button(
+                label="◀",
+                style=discord.ButtonStyle.gray,
+                custom_id="rb_view_{}:page:{}".format(view.idx, group - 1),
+                row=MAX_ROWS - 1,
+            )
+            self.add_item(prevBtn)
+
+        if group < compiled.groups - 1:
+            nextBtn = discord.ui.Button(
+                label="▶",
+                style=discord.ButtonStyle.gray,
+                custom_id="rb_view_{}:page:{}".format(view.idx, group + 1),
+                row=MAX_ROWS - 1,
+            )
+            self.add_item(nextBtn)
+
+        # Interactions are routed by module, the view is not stored by bot
+        self.stop()
+
+    def _select_id(self, page: int) -> str:
+        """Get stable custom_id of OptionDropdown.
+        The first page keeps ID used before paging was introduced.
 
-    async def _remove_items(
-        self,
-        member: discord.Member,
-        roles: List[discord.Role],
-        channels: List[discord.abc.GuildChannel],
-    ) -> bool:
-        """Internal function to remove roles and permissions.
         Args:
-            member: Affected :class:`discord.Member`
-            roles: List of :class:`discord.Role` to remove
-            channels: List of :class:`discord.abc.GuildChannel` to remove
+            page: Index of page
 
         Returns:
-            True if no error, False if Exception was raised.
+            Custom ID of OptionDropdown
         """
-        for role in roles:
-            if role not in member.roles:
-                roles.remove(role)
-
-        try:
-            await member.remove_roles(*roles, reason="ReactionButtons")
-            for channel in channels:
-                overwrites = channel.overwrites
-                if member not in overwrites or not overwrites[member].read_messages:
-                    continue
-                await channel.set_permissions(member, overwrite=None)
-            return True
-        except (discord.Forbidden, discord.HTTPException) as ex:
-            await guild_log.error(
-                member,
-                member.guild,
-                "Exception occured during removing items in ReactionButtons.",
-                exception=ex,
-            )
-            return False
+        if page == 0:
+            return "rb_view_{}:select".format(self.compiled.view.idx)
+        return "rb_view_{}:select:{}".format(self.compiled.view.idx, page)
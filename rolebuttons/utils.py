@@ -1,6 +1,7 @@
 import re
+import time
 
-from typing import Optional, Union, List, Tuple
+from typing import AbstractSet, Any, Dict, Iterable, Optional, Set, Union, List, Tuple
 
 import discord
 
@@ -8,16 +9,182 @@ from pie import i18n, logger
 
 from .database import DiscordType, RBItem
 
-EMOJI_REGEX = "^:[a-zA-Z0-9]+:$"
+EMOJI_REGEX = re.compile(r"^:[a-zA-Z0-9]+:$")
 
 _ = i18n.Translator("modules/rolebuttons").translate
 guild_log = logger.Guild.logger()
 
 
+class EmojiIndex:
+    """Index of custom emojis of bot's guilds by their ID and name.
+
+    It replaces linear search in `bot.emojis`. It's built from all bot's guilds
+    independently of loading their views and kept up to date by the module
+    (see `on_guild_available`, `on_guild_join`, `on_guild_remove`
+    and `on_guild_emojis_update` listeners).
+    """
+
+    def __init__(self):
+        self._guilds: Dict[int, Tuple[discord.Emoji, ...]] = {}
+        self._by_id: Dict[int, discord.Emoji] = {}
+        self._by_name: Dict[str, Dict[int, discord.Emoji]] = {}
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def build(self, guilds: Iterable[discord.Guild]):
+        """Index emojis of all guilds.
+
+        Args:
+            guilds: Bot's guilds
+        """
+        self._guilds = {}
+        self._by_id = {}
+        self._by_name = {}
+
+        for guild in guilds:
+            self.update(guild.id, guild.emojis)
+
+    def update(self, guild_id: int, emojis: Iterable[discord.Emoji]) -> Set[int]:
+        """Replace indexed emojis of guild.
+
+        Args:
+            guild_id: ID of guild
+            emojis: Actual emojis of guild
+
+        Returns:
+            IDs of emojis which were added, removed or renamed.
+        """
+        previous = {emoji.id: emoji.name for emoji in self._guilds.get(guild_id, ())}
+        self.remove(guild_id)
+
+        emojis = tuple(emojis)
+        self._guilds[guild_id] = emojis
+        for emoji in emojis:
+            self._by_id[emoji.id] = emoji
+            self._by_name.setdefault(emoji.name, {})[emoji.id] = emoji
+
+        current = {emoji.id: emoji.name for emoji in emojis}
+        return {
+            emoji_id
+            for emoji_id in previous.keys() | current.keys()
+            if previous.get(emoji_id) != current.get(emoji_id)
+        }
+
+    def remove(self, guild_id: int) -> Set[int]:
+        """Remove indexed emojis of guild.
+
+        Args:
+            guild_id: ID of guild
+
+        Returns:
+            IDs of removed emojis.
+        """
+        removed = set()
+        for emoji in self._guilds.pop(guild_id, ()):
+            removed.add(emoji.id)
+            self._by_id.pop(emoji.id, None)
+            named = self._by_name.get(emoji.name, {})
+            named.pop(emoji.id, None)
+            if not named:
+                self._by_name.pop(emoji.name, None)
+
+        return removed
+
+    def get(self, emoji_id: int) -> Optional[discord.Emoji]:
+        """Get emoji by it's ID.
+
+        Args:
+            emoji_id: ID of emoji
+
+        Returns:
+            Emoji or None if it's not in bot's guilds
+        """
+        return self._by_id.get(emoji_id, None)
+
+    def get_by_name(self, name: str) -> Optional[discord.Emoji]:
+        """Get emoji by it's name. If more guilds have emoji with
+        the same name, the first indexed one is returned.
+
+        Args:
+            name: Name of emoji
+
+        Returns:
+            Emoji or None if it's not in bot's guilds
+        """
+        named = self._by_name.get(name, None)
+        if not named:
+            return None
+        return next(iter(named.values()))
+
+
+class ErrorReporter:
+    """Collects errors of invalid role and channel IDs and logs them
+    as summaries, so processing of interactions does not wait for logging.
+
+    Each (guild, ID) combination is logged at most once per `window` seconds
+    with number of occurrences since the last report. Reports are logged
+    by :meth:`flush`, which is called periodically by the module.
+
+    Attributes:
+        window: Number of seconds in which repeated errors are suppressed
+    """
+
+    def __init__(self, window: float = 3600.0):
+        self.window = window
+        self._pending: Dict[Tuple[int, str, int], Tuple[discord.Guild, int]] = {}
+        self._reported: Dict[Tuple[int, str, int], float] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def report(self, guild: discord.Guild, kind: str, discord_id: int):
+        """Record invalid ID. It does not log anything.
+
+        Args:
+            guild: Guild of the ID
+            kind: Type of Discord object (role or channel)
+            discord_id: Invalid ID
+        """
+        key = (guild.id, kind, discord_id)
+        count = self._pending[key][1] if key in self._pending else 0
+        self._pending[key] = (guild, count + 1)
+
+    async def flush(self, force: bool = False):
+        """Log summaries of errors whose suppression window passed.
+
+        Args:
+            force: Log all recorded errors regardless of the window
+        """
+        now = time.monotonic()
+
+        for key in [
+            key
+            for key, reported in self._reported.items()
+            if now - reported >= self.window and key not in self._pending
+        ]:
+            del self._reported[key]
+
+        for key, (guild, count) in list(self._pending.items()):
+            reported = self._reported.get(key, None)
+            if not force and reported is not None and now - reported < self.window:
+                continue
+
+            del self._pending[key]
+            self._reported[key] = now
+            guild_id, kind, discord_id = key
+            await guild_log.error(
+                None,
+                guild,
+                f"There's invalid {kind} ID {discord_id} in ReactionButton's database! "
+                f"Occurred {count} times since last report.",
+            )
+
+
 class RBUtils:
     @staticmethod
     def emoji_encode(
-        bot: discord.Client, emoji: Union[discord.PartialEmoji, str]
+        emojis: EmojiIndex, emoji: Union[discord.PartialEmoji, str]
     ) -> Optional[str]:
         """Gets emoji and translate it to str.
 
@@ -28,7 +195,7 @@ class RBUtils:
 
 
         Args:
-            bot: :class:`discord.Client` used to search for Emoji
+            emojis: :class:`EmojiIndex` used to search for Emoji
             emoji: UTF-8 emoji, Discord emoji or :emoji_name: for lookup
 
         Returns:
@@ -36,12 +203,12 @@ class RBUtils:
 
         """
         if isinstance(emoji, discord.PartialEmoji):
-            found_emoji = discord.utils.get(bot.emojis, id=emoji.id)
+            found_emoji = emojis.get(emoji.id)
             if not found_emoji:
                 return None
             return str(found_emoji.id)
-        elif re.match(EMOJI_REGEX, emoji):
-            found_emoji = discord.utils.get(bot.emojis, name=emoji.replace(":", ""))
+        elif EMOJI_REGEX.match(emoji):
+            found_emoji = emojis.get_by_name(emoji.replace(":", ""))
             if not found_emoji:
                 return None
             return str(found_emoji.id)
@@ -50,14 +217,14 @@ class RBUtils:
 
     @staticmethod
     def emoji_decode(
-        bot: discord.Client,
+        emojis: EmojiIndex,
         emoji: str,
     ) -> Optional[Union[str, discord.Emoji, discord.PartialEmoji]]:
         """If emoji is ID, it tries to look it up in bot's emoji DB.
         Otherwise it returns the emoji untouched as string.
 
         Args:
-            bot: :class:`discord.Client` used to search for Emoji
+            emojis: :class:`EmojiIndex` used to search for Emoji
             emoji: UTF-8 emoji or emoji's ID
 
         Returns:
@@ -70,51 +237,226 @@ class RBUtils:
         if not emoji.isdigit():
             return emoji
 
-        found_emoji = discord.utils.get(bot.emojis, id=int(emoji))
+        found_emoji = emojis.get(int(emoji))
         if found_emoji:
             return found_emoji
         else:
             return emoji
 
+    @staticmethod
+    def check_restrictions(
+        role_ids: AbstractSet[int],
+        allowed: AbstractSet[int],
+        disallowed: AbstractSet[int],
+    ) -> bool:
+        """Checks if user has one of allowed roles (if there are any)
+        and does not have any of disallowed roles.
+
+        Args:
+            role_ids: IDs of user's roles
+            allowed: IDs of allowed roles
+            disallowed: IDs of disallowed roles
+
+        Returns:
+            :class:`bool`: True if user is allowed, False otherwise.
+        """
+        if not disallowed.isdisjoint(role_ids):
+            return False
+
+        return not allowed or not allowed.isdisjoint(role_ids)
+
     @staticmethod
     async def process_items(
-        items: List[RBItem], guild: discord.Guild
+        items: List[RBItem],
+        guild: discord.Guild,
+        reporter: Optional[ErrorReporter] = None,
     ) -> Tuple[discord.Role, discord.abc.GuildChannel]:
         """Internal function to convert List of RBItem DB objects
         to Discord roles and channels.
         Args:
             items: List of :class:`RBItem` to process
+            reporter: Reporter collecting invalid IDs (logged right away if None)
 
         Returns:
             Tuple of Lists, first containing roles, second containing Channels
         """
+        role_ids, channel_ids = RBUtils.split_items(items)
+
+        return await RBUtils.get_items(guild, role_ids, channel_ids, reporter)
+
+    @staticmethod
+    def split_items(items: List[RBItem]) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+        """Split List of RBItem DB objects to role and channel IDs.
+
+        Args:
+            items: List of :class:`RBItem` to split
+
+        Returns:
+            Tuple of tuples, first containing role IDs, second containing channel IDs
+        """
+        role_ids = tuple(
+            item.discord_id for item in items if item.discord_type == DiscordType.ROLE
+        )
+        channel_ids = tuple(
+            item.discord_id for item in items if item.discord_type != DiscordType.ROLE
+        )
+
+        return role_ids, channel_ids
+
+    @staticmethod
+    async def get_items(
+        guild: discord.Guild,
+        role_ids: Iterable[int],
+        channel_ids: Iterable[int],
+        reporter: Optional[ErrorReporter] = None,
+    ) -> Tuple[List[discord.Role], List[discord.abc.GuildChannel]]:
+        """Convert role and channel IDs to Discord roles and channels.
+        Invalid IDs are logged (or passed to reporter) and skipped.
+
+        Args:
+            guild: Guild of roles and channels
+            role_ids: IDs of roles
+            channel_ids: IDs of channels
+            reporter: Reporter collecting invalid IDs (logged right away if None)
+
+        Returns:
+            Tuple of Lists, first containing roles, second containing Channels
+        """
+        roles = await RBUtils.get_roles(guild, role_ids, reporter)
+        channels = await RBUtils.get_channels(guild, channel_ids, reporter)
+
+        return roles, channels
+
+    @staticmethod
+    async def get_roles(
+        guild: discord.Guild,
+        role_ids: Iterable[int],
+        reporter: Optional[ErrorReporter] = None,
+    ) -> List[discord.Role]:
+        """Convert role IDs to Discord roles.
+        Invalid IDs are logged (or passed to reporter) and skipped.
+
+        Args:
+            guild: Guild of roles
+            role_ids: IDs of roles
+            reporter: Reporter collecting invalid IDs (logged right away if None)
+
+        Returns:
+            List of roles
+        """
         roles = []
+
+        for role_id in role_ids:
+            role = guild.get_role(role_id)
+            if not role and reporter is not None:
+                reporter.report(guild, "role", role_id)
+                continue
+            if not role:
+                await guild_log.error(
+                    None,
+                    guild,
+                    "There's invalid role ID {} in ReactionButton's database!".format(
+                        role_id
+                    ),
+                )
+                continue
+            roles.append(role)
+
+        return roles
+
+    @staticmethod
+    async def get_channels(
+        guild: discord.Guild,
+        channel_ids: Iterable[int],
+        reporter: Optional[ErrorReporter] = None,
+    ) -> List[discord.abc.GuildChannel]:
+        """Convert channel IDs to Discord channels.
+        Invalid IDs are logged (or passed to reporter) and skipped.
+
+        Args:
+            guild: Guild of channels
+            channel_ids: IDs of channels
+            reporter: Reporter collecting invalid IDs (logged right away if None)
+
+        Returns:
+            List of channels
+        """
         channels = []
 
-        for item in items:
-            if item.discord_type == DiscordType.ROLE:
-                role = guild.get_role(item.discord_id)
-                if not role:
-                    await guild_log.error(
-                        None,
-                        guild,
-                        "There's invalid role ID {} in ReactionButton's database!".format(
-                            item.discord_id
-                        ),
+        for channel_id in channel_ids:
+            channel = guild.get_channel(channel_id)
+            invalid = not channel or not isinstance(channel, discord.abc.GuildChannel)
+            if invalid and reporter is not None:
+                reporter.report(guild, "channel", channel_id)
+                continue
+            if invalid:
+                await guild_log.error(
+                    None,
+                    guild,
+                    "There's invalid channel ID {} in ReactionButton's database!".format(
+                        channel_id
+                    ),
+                )
+                continue
+            channels.append(channel)
+
+        return channels
+
+    @staticmethod
+    def _emoji_signature(emoji: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Convert emoji payload to comparable string.
+
+        Args:
+            emoji: Emoji payload or None
+
+        Returns:
+            ID of custom emoji, UTF-8 emoji or None
+        """
+        if not emoji:
+            return None
+        return str(emoji["id"]) if emoji.get("id") else emoji.get("name")
+
+    @staticmethod
+    def components_signature(components: List[Dict[str, Any]]) -> Tuple:
+        """Convert component payloads to comparable tuple.
+
+        It's used to compare components of existing message
+        with components rendered by view, so only messages
+        which actually differ are edited.
+
+        Args:
+            components: List of action row payloads
+
+        Returns:
+            Tuple of rows, each containing tuple of component signatures
+        """
+        signature = []
+
+        for row in components:
+            row_signature = []
+            for component in row.get("components", []):
+                options = tuple(
+                    (
+                        option.get("label"),
+                        str(option.get("value")),
+                        option.get("description"),
+                        RBUtils._emoji_signature(option.get("emoji")),
                     )
-                    continue
-                roles.append(role)
-            else:
-                channel = guild.get_channel(item.discord_id)
-                if not channel or not isinstance(channel, discord.abc.GuildChannel):
-                    await guild_log.error(
-                        None,
-                        guild,
-                        "There's invalid channel ID {} in ReactionButton's database!".format(
-                            item.discord_id
-                        ),
+                    for option in component.get("options", [])
+                )
+                row_signature.append(
+                    (
+                        component.get("type"),
+                        component.get("custom_id"),
+                        component.get("label"),
+                        component.get("style"),
+                        component.get("placeholder"),
+                        component.get("min_values"),
+                        component.get("max_values"),
+                        RBUtils._emoji_signature(component.get("emoji")),
+                        options,
                     )
-                    continue
-                channels.append(channel)
+                )
+            signature.append(tuple(row_signature))
 
-        return roles, channels
+        return tuple(signature)